@@ -0,0 +1,228 @@
+"""
+Append-only analytics log shared by the Discord and Twitter bots
+Records are written as one JSON object per line (NDJSON) by a background
+thread that batches them, so logging a question never re-reads or rewrites
+the history. Appends take an exclusive file lock so both bot processes can
+write to the same file safely.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: rely on O_APPEND alone
+    fcntl = None
+
+ANALYTICS_FILE = 'analytics.ndjson'
+LEGACY_ANALYTICS_FILE = 'analytics.json'
+
+logger = logging.getLogger('taofu.analytics')
+
+def get_analytics_file():
+    """Path of the NDJSON analytics log"""
+    return os.getenv('ANALYTICS_FILE', ANALYTICS_FILE)
+
+def _lock(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _unlock(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def make_record(user_id, username, question, response_preview, platform, **extra):
+    """Build an analytics record; `extra` adds measurements such as timings"""
+    record = {
+        'timestamp': datetime.now().isoformat(),
+        'user_id': str(user_id),
+        'username': username,
+        'question': question,
+        'response_preview': response_preview[:100] + "..." if len(response_preview) > 100 else response_preview,
+        'platform': platform
+    }
+    record.update(extra)
+    return record
+
+def migrate_legacy(path=None, legacy_path=None):
+    """Move records from the old analytics.json array into the NDJSON log
+
+    The legacy file is looked for next to the log unless `legacy_path` is
+    given, so a log in a scratch directory never takes the real history.
+    Runs once: the legacy file is renamed to analytics.json.migrated
+    afterwards. Migrated records go before anything already in the log.
+    """
+    path = path or get_analytics_file()
+    legacy_path = legacy_path or os.path.join(os.path.dirname(path), LEGACY_ANALYTICS_FILE)
+    if not os.path.exists(legacy_path):
+        return 0
+
+    with open(path, 'a+', encoding='utf-8') as f:
+        _lock(f)
+        try:
+            # Another process may have migrated while we waited for the lock
+            if not os.path.exists(legacy_path):
+                return 0
+            try:
+                with open(legacy_path, 'r') as legacy:
+                    records = json.load(legacy)
+            except json.JSONDecodeError:
+                logger.warning("Error reading %s, skipping migration. File may be corrupted.", legacy_path)
+                return 0
+
+            f.seek(0)
+            existing = f.read()
+            f.seek(0)
+            f.truncate()
+            f.write(''.join(json.dumps(r) + '\n' for r in records))
+            f.write(existing)
+            f.flush()
+            os.fsync(f.fileno())
+            os.replace(legacy_path, legacy_path + '.migrated')
+        finally:
+            _unlock(f)
+
+    logger.info("Migrated %d analytics records from %s to %s", len(records), legacy_path, path)
+    return len(records)
+
+def _timestamp(line):
+    try:
+        return json.loads(line).get('timestamp', '')
+    except json.JSONDecodeError:
+        return ''
+
+def _seek_since(f, since):
+    """Binary search the time-ordered log for the first record at or after `since`"""
+    f.seek(0, os.SEEK_END)
+    lo, hi = 0, f.tell()
+    while lo < hi:
+        mid = (lo + hi) // 2
+        # Move to the start of the first line beginning at or after mid
+        f.seek(max(mid - 1, 0))
+        if mid:
+            f.readline()
+        line = f.readline()
+        if not line or _timestamp(line) >= since:
+            hi = mid
+        else:
+            lo = mid + 1
+    f.seek(max(lo - 1, 0))
+    if lo:
+        f.readline()
+
+def read_records(path=None, since=None):
+    """Yield analytics records one at a time
+
+    With `since` (an ISO timestamp or date), records before it are skipped
+    by seeking instead of reading the whole log.
+    """
+    path = path or get_analytics_file()
+    with open(path, 'rb') as f:
+        if since:
+            _seek_since(f, since)
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A torn write from a crash; skip it rather than failing the report
+                continue
+
+class AnalyticsWriter:
+    """Batches analytics records and appends them from a background thread
+
+    Only a writer on the configured ANALYTICS_FILE migrates the legacy
+    analytics.json; one given an explicit `path` (tests, tools) leaves it
+    alone unless `legacy_path` is passed too.
+    """
+
+    def __init__(self, path=None, batch_size=100, flush_interval=1.0, legacy_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self.path = path or get_analytics_file()
+        if path is None or legacy_path:
+            migrate_legacy(self.path, legacy_path)
+        self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        """Queue a record for writing; never blocks on disk I/O"""
+        self._queue.put(record)
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Write any queued records and stop the background thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            # Gather whatever else arrives within the flush interval
+            deadline = time.monotonic() + self.flush_interval
+            while record is not None and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(record)
+
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    self._write(records)
+            except Exception:
+                logger.exception("Error writing analytics")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if len(records) < len(batch):
+                return
+
+    def _write(self, records):
+        with metrics.ANALYTICS_WRITE_LATENCY.time():
+            data = ''.join(json.dumps(r) + '\n' for r in records)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                _lock(f)
+                try:
+                    f.write(data)
+                    f.flush()
+                finally:
+                    _unlock(f)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Shared writer for this process"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AnalyticsWriter()
+        return _writer
+
+def log_question(user_id, username, question, response_preview, platform, **extra):
+    """Queue an analytics record for a question"""
+    with metrics.LOG_QUESTION_LATENCY.time():
+        get_writer().log(make_record(user_id, username, question, response_preview, platform, **extra))
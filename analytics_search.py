@@ -0,0 +1,213 @@
+"""
+Full-text search index over the analytics log
+Keeps a SQLite FTS5 index of questions and response previews next to
+analytics.ndjson. The index remembers how far into the log it has read, so
+each search only indexes the records appended since the last one.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+
+import analytics_log
+
+INDEX_FILE = 'analytics_index.db'
+BATCH_SIZE = 5000
+# Newest records ranked by a search without --since/--until (widened when short)
+SEARCH_WINDOW = 10000
+
+def build_match_query(query):
+    """Turn a user query into an FTS5 MATCH expression
+
+    Terms are ANDed by default; `OR` between terms matches either, and a
+    trailing `*` matches by prefix (e.g. `whitelist*`).
+    """
+    parts = []
+    for term in query.split():
+        if term.upper() in ('AND', 'OR'):
+            if parts and parts[-1] not in ('AND', 'OR'):
+                parts.append(term.upper())
+            continue
+        prefix = term.endswith('*')
+        words = re.findall(r'\w+', term)
+        if not words:
+            continue
+        phrase = '"' + ' '.join(words) + '"'
+        parts.append(phrase + '*' if prefix else phrase)
+    while parts and parts[-1] in ('AND', 'OR'):
+        parts.pop()
+    return ' '.join(parts)
+
+class SearchIndex:
+    """Incrementally updated FTS5 index of analytics records"""
+
+    def __init__(self, path=None, log_path=None):
+        self.path = path or os.getenv('ANALYTICS_INDEX_FILE', INDEX_FILE)
+        self.log_path = log_path or analytics_log.get_analytics_file()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                username TEXT,
+                platform TEXT,
+                question TEXT,
+                response_preview TEXT
+            );
+            CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+            CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+                question, response_preview,
+                content='records', content_rowid='id',
+                tokenize='porter unicode61'
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        ''')
+        # Rank matches in the question column above those in the response preview
+        with self._conn:
+            self._conn.execute("INSERT INTO records_fts (records_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def _log_fingerprint(self, f):
+        # The first line identifies the log; it changes if the log is replaced or migrated
+        f.seek(0)
+        return hashlib.sha256(f.readline()).hexdigest()
+
+    def _reset(self):
+        self._conn.execute('DELETE FROM records')
+        self._conn.execute("INSERT INTO records_fts (records_fts) VALUES ('delete-all')")
+        self._conn.execute('DELETE FROM meta')
+
+    def update(self):
+        """Index records appended to the log since the last update"""
+        if not os.path.exists(self.log_path):
+            return 0
+
+        added = 0
+        with open(self.log_path, 'rb') as f, self._conn:
+            fingerprint = self._log_fingerprint(f)
+            offset = int(self._meta('offset', 0))
+            f.seek(0, os.SEEK_END)
+            if fingerprint != self._meta('fingerprint') or f.tell() < offset:
+                self._reset()
+                offset = 0
+
+            f.seek(offset)
+            batch = []
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Still being written; pick it up next time
+                    break
+                offset += len(line)
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                batch.append((
+                    item.get('timestamp', ''),
+                    item.get('username'),
+                    item.get('platform'),
+                    item.get('question', ''),
+                    item.get('response_preview', '')
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    added += self._insert(batch)
+                    batch = []
+            added += self._insert(batch)
+
+            self._set_meta('offset', offset)
+            self._set_meta('fingerprint', fingerprint)
+        return added
+
+    def _insert(self, batch):
+        if not batch:
+            return 0
+        cursor = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM records')
+        first_id = cursor.fetchone()[0] + 1
+        rows = [(first_id + i,) + row for i, row in enumerate(batch)]
+        self._conn.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self._conn.executemany(
+            'INSERT INTO records_fts (rowid, question, response_preview) VALUES (?, ?, ?)',
+            [(row[0], row[4], row[5]) for row in rows]
+        )
+        return len(rows)
+
+    def _id_range(self, since, until):
+        """Lowest and highest record id in a time window, from the timestamp index"""
+        conditions = []
+        params = []
+        if since:
+            conditions.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            conditions.append('timestamp <= ?')
+            params.append(until)
+        where = ' AND '.join(conditions)
+        return self._conn.execute(f'SELECT MIN(id), MAX(id) FROM records WHERE {where}', params).fetchone()
+
+    def search(self, query, platform=None, since=None, until=None, limit=50):
+        """Return the best matching records for a query
+
+        A --since/--until window is looked up in the timestamp index first
+        and passed to FTS5 as a rowid range, so a narrow window only ranks
+        the matches inside it. Records are indexed in log order, so the
+        range covers the window; the timestamp filter below drops the rest.
+
+        Without a window only the newest records are ranked, starting with
+        the last SEARCH_WINDOW and doubling back into older history until
+        there are enough matches, so common terms don't rank the whole log.
+        """
+        match = build_match_query(query)
+        if not match:
+            return []
+        # Inclusive: every timestamp starting with `until` sorts before this
+        until = until + '\uffff' if until else None
+
+        filters = []
+        params = []
+        if since or until:
+            low, high = self._id_range(since, until)
+            if low is None:
+                return []
+            filters.append('records_fts.rowid BETWEEN ? AND ?')
+            params.extend([low, high])
+        if since:
+            filters.append('r.timestamp >= ?')
+            params.append(since)
+        if until:
+            filters.append('r.timestamp <= ?')
+            params.append(until)
+        if platform:
+            filters.append('LOWER(r.platform) = LOWER(?)')
+            params.append(platform)
+
+        if since or until:
+            rows = self._ranked(match, filters, params, limit)
+        else:
+            newest = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM records').fetchone()[0]
+            window = int(os.getenv('ANALYTICS_SEARCH_WINDOW', SEARCH_WINDOW))
+            while True:
+                floor = max(newest - window, 0)
+                rows = self._ranked(match, ['records_fts.rowid > ?'] + filters, [floor] + params, limit)
+                if len(rows) >= limit or floor == 0:
+                    break
+                window *= 2
+
+        keys = ('timestamp', 'username', 'platform', 'question', 'response_preview')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _ranked(self, match, filters, params, limit):
+        condition = ' AND '.join(['records_fts MATCH ?'] + filters)
+        return self._conn.execute(
+            'SELECT r.timestamp, r.username, r.platform, r.question, r.response_preview '
+            'FROM records_fts JOIN records r ON r.id = records_fts.rowid '
+            f'WHERE {condition} ORDER BY rank LIMIT ?',
+            [match] + params + [limit]
+        ).fetchall()
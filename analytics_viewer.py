@@ -4,26 +4,132 @@ Simple analytics viewer for Taofu bot data
 Run this to analyze questions and user engagement
 """
 
+import heapq
 import json
-from collections import Counter
+import math
+import os
+from collections import Counter, deque
 from datetime import datetime, timedelta
+from operator import itemgetter
 import sys
+import time
 
-def load_analytics():
-    """Load analytics data from JSON file"""
-    try:
-        with open('analytics.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
+import analytics_log
+from analytics_search import SearchIndex
+from knowledge_index import KnowledgeIndex
+from prompt_bundle import KNOWLEDGE_FILE
+
+# USD per 1K prompt / completion tokens, for estimating spend
+MODEL_PRICES = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-4o': (0.005, 0.015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-3.5-turbo': (0.0015, 0.002)
+}
+
+class TopCounter:
+    """Approximate counter for the most frequent items in bounded memory
+
+    Keeps at most 2 * capacity keys; when it fills up, the less frequent half
+    is dropped. Items frequent enough to matter for a top 10 survive.
+    """
+
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item):
+        self.counts[item] = self.counts.get(item, 0) + 1
+        if len(self.counts) > 2 * self.capacity:
+            self.counts = dict(heapq.nlargest(self.capacity, self.counts.items(), key=itemgetter(1)))
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+class LatencyHistogram:
+    """Approximate percentiles in bounded memory
+
+    Counts values in logarithmic buckets 5% wide, so a percentile is within
+    5% of the exact value however many records there are.
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+
+    def add(self, value):
+        self.buckets[math.floor(math.log(max(value, 0.001), self.GROWTH))] += 1
+        self.count += 1
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Upper edge of the bucket, so percentiles are never understated
+                return self.GROWTH ** (bucket + 1)
+        return 0.0
+
+def answer_cost(item):
+    """Estimated USD cost of one answer, or 0 for unknown models"""
+    prompt_price, completion_price = MODEL_PRICES.get(item.get('model'), (0, 0))
+    return (item.get('prompt_tokens', 0) * prompt_price + item.get('completion_tokens', 0) * completion_price) / 1000
+
+def question_type(index, question):
+    """The knowledge base topic (## heading) a question matches best"""
+    best = index.search(question, k=1)
+    if not best:
+        return 'Other'
+    section = index.sections[best[0][0]]
+    return section.group or section.title or 'Other'
+
+def iter_window(records, since=None, until=None):
+    """Limit records to a time window; `until` is inclusive"""
+    for item in records:
+        timestamp = item['timestamp']
+        if until and timestamp[:len(until)] > until:
+            # The log is written in time order, so nothing later can match
+            break
+        if since and timestamp < since:
+            continue
+        yield item
+
+def load_analytics(since=None, until=None):
+    """Stream analytics records from the NDJSON log"""
+    # Bring over records from the old analytics.json format first
+    analytics_log.migrate_legacy()
+    if not os.path.exists(analytics_log.get_analytics_file()):
         print("No analytics data found. Run the bots first to collect data.")
-        return []
-    except json.JSONDecodeError:
-        print("Error reading analytics.json. File may be corrupted.")
-        return []
+        return iter(())
+    return iter_window(analytics_log.read_records(since=since), since, until)
 
 def analyze_questions(analytics):
-    """Analyze the most common questions"""
-    if not analytics:
+    """Analyze the most common questions in a single pass"""
+    total_questions = 0
+    platforms = Counter()
+    date_counts = Counter()
+    question_counts = TopCounter()
+    users = TopCounter()
+    recent_cutoff = (datetime.now() - timedelta(days=7)).isoformat()
+    recent_count = 0
+    recent = deque(maxlen=5)  # Last 5 questions
+
+    for item in analytics:
+        total_questions += 1
+        platforms[item['platform']] += 1
+        date_counts[item['timestamp'][:10]] += 1
+        question_counts.add(item['question'].lower().strip())
+        users.add(item['username'])
+        if item['timestamp'] > recent_cutoff:
+            recent_count += 1
+            recent.append(item)
+
+    if not total_questions:
         print("No data to analyze.")
         return
     
@@ -32,106 +138,184 @@ def analyze_questions(analytics):
     print("=" * 60)
     
     # Basic stats
-    total_questions = len(analytics)
     print(f"\n📊 Total Questions: {total_questions}")
     
     # Platform breakdown
-    platforms = Counter(item['platform'] for item in analytics)
     print(f"\n📱 Platform Breakdown:")
     for platform, count in platforms.items():
         print(f"  {platform}: {count} questions")
     
     # Time analysis
-    if analytics:
-        dates = [datetime.fromisoformat(item['timestamp'].split('T')[0]) for item in analytics]
-        date_counts = Counter(dates)
-        
-        print(f"\n📅 Questions by Date:")
-        for date, count in sorted(date_counts.items()):
-            print(f"  {date.strftime('%Y-%m-%d')}: {count} questions")
+    print(f"\n📅 Questions by Date:")
+    for date, count in sorted(date_counts.items()):
+        print(f"  {date}: {count} questions")
     
     # Most common questions
-    questions = [item['question'].lower().strip() for item in analytics]
-    question_counts = Counter(questions)
-    
     print(f"\n❓ Top 10 Most Asked Questions:")
     for i, (question, count) in enumerate(question_counts.most_common(10), 1):
         print(f"  {i}. \"{question}\" ({count} times)")
     
     # User engagement
-    users = Counter(item['username'] for item in analytics)
     print(f"\n👥 Top 10 Most Active Users:")
     for i, (username, count) in enumerate(users.most_common(10), 1):
         print(f"  {i}. {username}: {count} questions")
     
     # Recent activity
-    if analytics:
-        recent = [item for item in analytics 
-                 if datetime.fromisoformat(item['timestamp']) > datetime.now() - timedelta(days=7)]
-        print(f"\n🕒 Recent Activity (Last 7 Days): {len(recent)} questions")
-        
-        if recent:
-            print("  Recent questions:")
-            for item in recent[-5:]:  # Last 5 questions
-                timestamp = datetime.fromisoformat(item['timestamp']).strftime('%m-%d %H:%M')
-                print(f"    [{timestamp}] {item['username']}: \"{item['question']}\"")
-
-def search_questions(analytics, search_term):
-    """Search for specific questions"""
-    matching = []
-    search_lower = search_term.lower()
+    print(f"\n🕒 Recent Activity (Last 7 Days): {recent_count} questions")
     
+    if recent:
+        print("  Recent questions:")
+        for item in recent:
+            timestamp = datetime.fromisoformat(item['timestamp']).strftime('%m-%d %H:%M')
+            print(f"    [{timestamp}] {item['username']}: \"{item['question']}\"")
+
+def analyze_performance(analytics):
+    """Report answer latency, token spend and the costliest question types in a single pass"""
+    try:
+        with open(KNOWLEDGE_FILE, 'r', encoding='utf-8') as f:
+            index = KnowledgeIndex(f.read())
+    except FileNotFoundError:
+        index = KnowledgeIndex('')
+
+    latencies = {}
+    outcomes = Counter()
+    spend = {}  # (date, platform) -> [prompt tokens, completion tokens, cost]
+    types = {}  # question type -> [answers, total tokens, cost]
+    total = 0
+    measured = 0
+
     for item in analytics:
-        if search_lower in item['question'].lower():
-            matching.append(item)
+        total += 1
+        if 'outcome' not in item:
+            # Logged before usage was recorded
+            continue
+        measured += 1
+        platform = item['platform']
+        outcomes[(platform, item['outcome'])] += 1
+        if 'llm_latency' in item:
+            key = f"{platform} {item['route']}" if 'route' in item else platform
+            latencies.setdefault(key, LatencyHistogram()).add(item['llm_latency'])
+        if 'prompt_tokens' not in item:
+            continue
+
+        cost = answer_cost(item)
+        day = spend.setdefault((item['timestamp'][:10], platform), [0, 0, 0.0])
+        day[0] += item['prompt_tokens']
+        day[1] += item['completion_tokens']
+        day[2] += cost
+        kind = types.setdefault(question_type(index, item['question']), [0, 0, 0.0])
+        kind[0] += 1
+        kind[1] += item['prompt_tokens'] + item['completion_tokens']
+        kind[2] += cost
+
+    if not measured:
+        print("No answers with usage data to analyze.")
+        return
+
+    print("=" * 60)
+    print("TAOFU BOT PERFORMANCE")
+    print("=" * 60)
+    print(f"\n📊 Answers with usage data: {measured} of {total}")
+
+    print("\n🎯 Outcomes:")
+    for (platform, outcome), count in sorted(outcomes.items()):
+        print(f"  {platform} {outcome}: {count} ({count / measured:.0%})")
+
+    print("\n⏱️  OpenAI Latency:")
+    for key, histogram in sorted(latencies.items()):
+        print(f"  {key}: p50 {histogram.percentile(50):.2f}s, p95 {histogram.percentile(95):.2f}s ({histogram.count} calls)")
+
+    print("\n🪙 Token Spend by Date:")
+    for (date, platform), (prompt_tokens, completion_tokens, cost) in sorted(spend.items()):
+        print(f"  {date} {platform}: {prompt_tokens} prompt + {completion_tokens} completion tokens (~${cost:.2f})")
+
+    print("\n💸 Costliest Question Types:")
+    costliest = heapq.nlargest(10, types.items(), key=lambda kv: (kv[1][2], kv[1][1]))
+    for i, (kind, (answers, tokens, cost)) in enumerate(costliest, 1):
+        print(f"  {i}. {kind}: ~${cost:.2f} over {answers} answers ({tokens // answers} tokens each)")
+
+def search_questions(query, platform=None, since=None, until=None, limit=50):
+    """Search questions and responses using the full-text index"""
+    index = SearchIndex()
+    added = index.update()
+    if added:
+        print(f"📇 Indexed {added} new records")
+
+    start = time.perf_counter()
+    matching = index.search(query, platform=platform, since=since, until=until, limit=limit)
+    elapsed_ms = (time.perf_counter() - start) * 1000
     
     if matching:
-        print(f"\n🔍 Found {len(matching)} questions containing '{search_term}':")
+        print(f"\n🔍 Best {len(matching)} questions matching '{query}' ({elapsed_ms:.0f} ms):")
         for item in matching:
             timestamp = datetime.fromisoformat(item['timestamp']).strftime('%Y-%m-%d %H:%M')
             print(f"  [{timestamp}] {item['username']} ({item['platform']}): \"{item['question']}\"")
     else:
-        print(f"\n❌ No questions found containing '{search_term}'")
+        print(f"\n❌ No questions found matching '{query}'")
 
 def export_data(analytics, filename='taofu_analytics_export.json'):
     """Export analytics data to a file"""
     try:
         with open(filename, 'w') as f:
-            json.dump(analytics, f, indent=2)
+            f.write('[')
+            for i, item in enumerate(analytics):
+                f.write(',\n' if i else '\n')
+                f.write(json.dumps(item, indent=2))
+            f.write('\n]\n')
         print(f"\n💾 Data exported to {filename}")
     except Exception as e:
         print(f"\n❌ Error exporting data: {e}")
 
+def pop_option(args, name):
+    """Remove `name value` from the argument list and return the value"""
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+    return None
+
 def main():
     """Main function"""
-    analytics = load_analytics()
-    
-    if not analytics:
-        return
+    args = sys.argv[1:]
+    since = pop_option(args, '--since')
+    until = pop_option(args, '--until')
+    platform = pop_option(args, '--platform')
     
     # Check for command line arguments
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    if args:
+        command = args[0]
         
-        if command == 'search' and len(sys.argv) > 2:
-            search_questions(analytics, sys.argv[2])
+        if command == 'search' and len(args) > 1:
+            analytics_log.migrate_legacy()
+            search_questions(' '.join(args[1:]), platform, since, until)
+        elif command == 'performance':
+            analyze_performance(load_analytics(since, until))
         elif command == 'export':
-            export_data(analytics)
+            export_data(load_analytics(since, until))
         elif command == 'help':
             print("""
-Usage: python analytics_viewer.py [command]
+Usage: python analytics_viewer.py [command] [--since DATE] [--until DATE] [--platform P]
 
 Commands:
   (no args)    - Show full analytics report
-  search <term> - Search for questions containing <term>
+  search <query> - Search questions and responses, best matches first
+                 (terms are ANDed; use OR between terms, term* for prefixes)
+  performance  - Show OpenAI latency percentiles, token spend and costliest question types
   export       - Export data to taofu_analytics_export.json
   help         - Show this help message
+
+Options:
+  --since DATE - Only include questions from DATE on (e.g. 2025-01-31)
+  --until DATE - Only include questions up to and including DATE
+  --platform P - Only search questions from platform P (Discord/Twitter)
             """)
         else:
             print("Unknown command. Use 'help' for usage information.")
     else:
         # Show full analytics
-        analyze_questions(analytics)
+        analyze_questions(load_analytics(since, until))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Persistent answer cache shared by the Discord and Twitter bots
+Answers are stored in SQLite keyed on the normalized question plus a hash of
+knowledge.txt and system_instructions.txt, so editing either file
+invalidates old answers automatically.
+
+Run `python answer_cache.py stats` to see hit/miss counts.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import metrics
+
+KNOWLEDGE_FILES = ('knowledge.txt', 'system_instructions.txt')
+
+CACHE_HITS = metrics.ANSWER_CACHE_LOOKUPS.labels('hit')
+CACHE_MISSES = metrics.ANSWER_CACHE_LOOKUPS.labels('miss')
+
+logger = logging.getLogger('taofu.answer_cache')
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = re.sub(r'[^\w\s]', ' ', question.lower())
+    return ' '.join(text.split())
+
+def content_version(contents):
+    """Hash file contents (bytes, or None for a missing file) into a short version"""
+    digest = hashlib.sha256()
+    for data in contents:
+        digest.update(data if data is not None else b'missing')
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+def knowledge_version(paths=KNOWLEDGE_FILES):
+    """Hash the contents of the knowledge files"""
+    contents = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        except FileNotFoundError:
+            contents.append(None)
+    return content_version(contents)
+
+class AnswerCache:
+    """LRU/TTL answer cache backed by a SQLite file
+
+    Several processes can share the same file; SQLite handles the locking.
+    Lookups only read: access times and hit/miss counts are kept in memory
+    and written together with the next put, or every flush_interval
+    seconds. If the file stays locked past the timeout, a lookup counts as a
+    miss and a store is skipped rather than failing the question.
+    """
+
+    def __init__(self, path=None, max_entries=None, ttl=None, version=None, flush_interval=None):
+        self.path = path or os.getenv('ANSWER_CACHE_FILE', 'answer_cache.db')
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1000))
+        self.ttl = ttl if ttl is not None else int(os.getenv('ANSWER_CACHE_TTL', 7 * 24 * 3600))
+        self.version = version or knowledge_version()
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('ANSWER_CACHE_FLUSH_INTERVAL', 30))
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}  # key -> last access not yet written
+        self._counts = {}  # stat name -> increment not yet written
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS answers (
+            key TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            namespace TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.invalidate_stale()
+
+    def _key(self, question, namespace, version):
+        raw = f"{namespace}\0{version}\0{normalize_question(question)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        self._counts[name] = self._counts.get(name, 0) + 1
+
+    def _flush(self):
+        """Write buffered access times and counters in one transaction (call with _lock held)"""
+        self._flushed_at = time.monotonic()
+        if not self._touched and not self._counts:
+            return
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._conn.executemany('UPDATE answers SET last_access = ? WHERE key = ?',
+                                   [(at, key) for key, at in self._touched.items()])
+            self._conn.executemany(
+                'INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                list(self._counts.items())
+            )
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._touched.clear()
+        self._counts.clear()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._flushed_at < self.flush_interval:
+            return
+        try:
+            self._flush()
+        except sqlite3.OperationalError as e:
+            # Kept for the next attempt; access times only steer eviction
+            logger.warning("Answer cache busy, deferring stats write: %s", e)
+
+    def flush(self):
+        """Write buffered access times and counters now"""
+        with self._lock:
+            self._flush()
+
+    def set_version(self, version):
+        """Switch to a new knowledge base version and drop older answers"""
+        self.version = version
+        self.invalidate_stale()
+
+    def invalidate_stale(self):
+        """Remove answers generated from an older knowledge base"""
+        with self._lock:
+            self._conn.execute('DELETE FROM answers WHERE version != ?', (self.version,))
+
+    def get(self, question, namespace='default', version=None):
+        """Return the cached answer for a question, or None
+
+        `version` defaults to the current knowledge base version; pass the
+        version a request started with so a reload mid-request cannot mix
+        answers from two knowledge bases.
+        """
+        key = self._key(question, namespace, version or self.version)
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute('SELECT answer, created_at FROM answers WHERE key = ?', (key,)).fetchone()
+            except sqlite3.OperationalError as e:
+                logger.warning("Answer cache unavailable, treating as a miss: %s", e)
+                row = None
+            # Expired answers are removed by the next put
+            if row and self.ttl and row[1] < now - self.ttl:
+                row = None
+
+            if row:
+                self._touched[key] = now
+                self._count('hits')
+                self.hits += 1
+                CACHE_HITS.inc()
+            else:
+                self._count('misses')
+                self.misses += 1
+                CACHE_MISSES.inc()
+            self._maybe_flush()
+            return row[0] if row else None
+
+    def put(self, question, answer, namespace='default', version=None):
+        """Store an answer and evict the least recently used entries"""
+        version = version or self.version
+        key = self._key(question, namespace, version)
+        now = time.time()
+        with self._lock:
+            try:
+                # Eviction needs current access times
+                self._flush()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, version, namespace, normalize_question(question), answer, now, now)
+                )
+                if self.ttl:
+                    self._conn.execute('DELETE FROM answers WHERE created_at < ?', (now - self.ttl,))
+                self._conn.execute(
+                    'DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning("Answer cache unavailable, answer not stored: %s", e)
+
+    def clear(self):
+        """Remove all cached answers and reset the counters"""
+        with self._lock:
+            self._conn.execute('DELETE FROM answers')
+            self._conn.execute('DELETE FROM stats')
+            self._touched.clear()
+            self._counts.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Hit/miss counts across all processes sharing the cache file"""
+        with self._lock:
+            self._flush()
+            counts = dict(self._conn.execute('SELECT name, value FROM stats').fetchall())
+            entries = self._conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        hits = counts.get('hits', 0)
+        misses = counts.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries
+        }
+
+def main():
+    """Show cache statistics or clear the cache"""
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    cache = AnswerCache()
+
+    if command == 'stats':
+        stats = cache.stats()
+        print(f"💾 Answer cache: {stats['entries']} entries")
+        print(f"  Hits: {stats['hits']}")
+        print(f"  Misses: {stats['misses']}")
+        print(f"  Hit rate: {stats['hit_rate']:.1%}")
+    elif command == 'clear':
+        cache.clear()
+        print("🧹 Answer cache cleared")
+    else:
+        print("Usage: python answer_cache.py [stats|clear]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Answer engine shared by the Taofu bots
+Holds the hot-reloaded prompts, the FAQ table, the answer cache and the model
+router. There is one engine per process, so when start.py runs the Discord and Twitter bots
+together they share a single copy of the knowledge base, its index and the
+cache connection instead of building their own.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+import faq_table
+import startup_profile
+from answer_cache import AnswerCache
+from model_router import ModelRouter
+from prompt_bundle import PromptWatcher
+
+logger = logging.getLogger('taofu.engine')
+
+class AnswerEngine:
+    """Prompts, FAQ table, answer cache and model router, kept on the same knowledge base version"""
+
+    def __init__(self, default_instructions):
+        self.prompts = PromptWatcher(default_instructions, on_reload=self._on_reload)
+        self.faq = faq_table.FaqTable()
+        self.cache = AnswerCache(version=self.prompts.bundle.version)
+        self.router = ModelRouter()
+        self._reloader = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _on_reload(self, bundle):
+        self.cache.set_version(bundle.version)
+        self._rebuild_faq(bundle)
+
+    def _rebuild_faq(self, bundle):
+        """Regenerate the FAQ table for a new knowledge base version in the background
+
+        Only tables that were built before are kept up to date, so a fresh
+        deployment never starts spending on FAQ answers by itself.
+        """
+        if self._loop is None or not self.faq.exists() or os.getenv('FAQ_AUTO_REBUILD', '1') == '0':
+            return
+        if self.faq.version == bundle.version:
+            return
+        future = asyncio.run_coroutine_threadsafe(faq_table.rebuild_if_stale(bundle, self.faq), self._loop)
+        future.add_done_callback(self._faq_rebuilt)
+
+    @staticmethod
+    def _faq_rebuilt(future):
+        if not future.cancelled() and future.exception():
+            logger.error("Error rebuilding FAQ table", exc_info=future.exception())
+
+    def start_reloader(self):
+        """Poll for prompt edits on the running loop, unless that already happens elsewhere
+
+        Returns the new task, or None if another loop is already polling.
+        """
+        with self._lock:
+            if self._reloader is not None and not self._reloader.done():
+                return None
+            self._loop = asyncio.get_running_loop()
+            self._reloader = self._loop.create_task(self.prompts.run())
+        # The knowledge base may have changed while the bot was down
+        self._rebuild_faq(self.prompts.bundle)
+        return self._reloader
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine(default_instructions):
+    """The engine for this process
+
+    `default_instructions` is only used if system_instructions.txt is
+    missing; when both bots share a process the first one to start decides.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            with startup_profile.phase('build prompts and cache'):
+                _engine = AnswerEngine(default_instructions)
+        return _engine
@@ -1,10 +1,42 @@
-from flask import Flask
+import logging
+import os
+import threading
+
+from flask import Flask, Response
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import metrics
 
 app = Flask(__name__)
 
+logger = logging.getLogger('taofu.app')
+
 @app.route('/')
 def home():
     return "Taofu Bot is running!"
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Skips the access log line for every health check and scrape"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+def start_background(port=None):
+    """Serve the health check and /metrics from a daemon thread of the calling process
+
+    The metrics live in memory, so the server has to run inside the bot
+    process it reports on.
+    """
+    port = int(port or os.getenv('METRICS_PORT') or os.getenv('PORT', 8080))
+    server = make_server('0.0.0.0', port, app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info("Health and metrics server on port %d", port)
+    return server
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
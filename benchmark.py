@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the Taofu bots
+Runs `!ask` and the Twitter mention loop against fake_openai_server.py with
+fake Discord and Twitter clients, and reports latency percentiles,
+throughput, event-loop blocking and memory use:
+
+    python benchmark.py --questions 200 --concurrency 20 --latency 0.5
+    python benchmark.py --only twitter --error-rate 0.05
+
+Nothing is sent to OpenAI, Discord or Twitter. Scratch files (answer cache,
+analytics, reply state) go to a temporary directory.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+from fake_openai_server import make_app
+
+QUESTIONS = [
+    "What is Taofu?",
+    "How does TPN work?",
+    "How do I mine on the network?",
+    "What is the difference between TAOFU and TPN?",
+    "How does staking work?",
+    "What are the tokenomics?",
+    "When is the next vesting unlock?",
+    "How can I join the community?"
+]
+
+FALLBACK_PREFIX = "I'm having trouble"
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def rss_mb():
+    """Current resident set size in MB (Linux), or None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def make_questions(count, distinct):
+    """`count` questions of which `distinct` differ (repeats exercise the cache)"""
+    return [f"{QUESTIONS[i % len(QUESTIONS)]} (variant {i})" for i in range(distinct)] * (count // distinct + 1)
+
+class LoopMonitor:
+    """Measures how long the event loop is blocked past a short sleep"""
+
+    def __init__(self, interval=0.01, threshold=0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    async def run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+
+class FakeMessage:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def edit(self, content=None, embed=None):
+        await asyncio.sleep(self.channel.send_latency)
+        self.channel.edits += 1
+        if embed is not None:
+            self.channel.answer = embed.description
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeUser:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+class FakeGuild:
+    def __init__(self, id):
+        self.id = id
+
+class FakeChannel:
+    def __init__(self, id):
+        self.id = id
+
+class FakeContext:
+    """Just enough of a discord.py Context for `!ask`"""
+
+    def __init__(self, user_id, guild_id, send_latency):
+        self.author = FakeUser(user_id, f"user{user_id}")
+        self.guild = FakeGuild(guild_id) if guild_id is not None else None
+        self.channel = FakeChannel(user_id)
+        self.send_latency = send_latency
+        self.started_at = time.perf_counter()
+        self.first_send_at = None
+        self.answer = ''
+        self.edits = 0
+
+    def typing(self):
+        return FakeTyping()
+
+    async def send(self, content=None, embed=None):
+        await asyncio.sleep(self.send_latency)
+        if self.first_send_at is None:
+            self.first_send_at = time.perf_counter()
+        if embed is not None:
+            self.answer = embed.description
+        return FakeMessage(self)
+
+class FakeTwitter:
+    """In-memory stand-in for twitter_api.V1Twitter / V2Twitter"""
+
+    def __init__(self, texts, post_latency):
+        self.post_latency = post_latency
+        self.mentions = {}
+        self.delivered_at = {}
+        self.posted_at = {}
+        self.replies = {}
+        self.done = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        from twitter_api import Mention
+        for i, text in enumerate(texts, start=1000):
+            self.mentions[i] = Mention(i, f"@taofu_bot {text}", 100 + i % 50, f"user{i % 50}")
+
+    def get_me(self):
+        return 1, 'taofu_bot'
+
+    def fetch_mentions(self, since_id=None, max_pages=20):
+        mentions = [m for m in self.mentions.values() if since_id is None or m.id > since_id]
+        now = time.perf_counter()
+        for mention in mentions:
+            self.delivered_at.setdefault(mention.id, now)
+        return mentions, {'remaining': 75, 'reset': int(time.time()) + 900, 'requests': 1}
+
+    def get_mention(self, tweet_id):
+        return self.mentions.get(tweet_id)
+
+    def replied_to(self, user_id):
+        return set(self.replies)
+
+    def post_reply(self, tweet_id, text):
+        time.sleep(self.post_latency)
+        self.posted_at[tweet_id] = time.perf_counter()
+        self.replies[tweet_id] = text
+        if len(self.replies) == len(self.mentions):
+            self.loop.call_soon_threadsafe(self.done.set)
+
+def summarize(name, latencies, elapsed, answers, monitor, rss_before, extra=None):
+    """Print one benchmark's results"""
+    errors = sum(1 for answer in answers if answer.startswith(FALLBACK_PREFIX))
+    rss_after = rss_mb()
+    print(f"\n📊 {name}: {len(latencies)} questions in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} questions/s)")
+    print(f"  Latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms, max {max(latencies, default=0) * 1000:.0f} ms")
+    for label, value in (extra or {}).items():
+        print(f"  {label}: {value}")
+    print(f"  Fallback answers: {errors} ({errors / max(len(answers), 1):.1%})")
+    print(f"  Event loop blocked: {monitor.blocked * 1000:.0f} ms over {monitor.stalls} stalls (max {monitor.max_lag * 1000:.1f} ms)")
+    if rss_before is not None and rss_after is not None:
+        print(f"  Memory: {rss_after:.1f} MB RSS (+{rss_after - rss_before:.1f} MB during run, peak {peak_rss_mb():.1f} MB)")
+
+async def bench_discord(args, questions):
+    """Ask every question through the !ask command with `concurrency` askers"""
+    import bot
+    ask = bot.ask_question.callback
+    queue = asyncio.Queue()
+    for i, question in enumerate(questions):
+        queue.put_nowait((i, question))
+
+    latencies, first_content, answers = [], [], []
+
+    async def asker():
+        while not queue.empty():
+            i, question = queue.get_nowait()
+            # One user per question and no guild, so the !ask rate limits stay out of the way
+            ctx = FakeContext(user_id=i, guild_id=None, send_latency=args.send_latency)
+            await ask(ctx, question=question)
+            latencies.append(time.perf_counter() - ctx.started_at)
+            if ctx.first_send_at is not None:
+                first_content.append(ctx.first_send_at - ctx.started_at)
+            answers.append(ctx.answer)
+
+    monitor = LoopMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    await asyncio.gather(*(asker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    monitor_task.cancel()
+    bot.analytics_log.get_writer().flush()
+
+    return lambda: summarize('Discord !ask', latencies, elapsed, answers, monitor, rss_before, {
+        'First content p50/p95': f"{percentile(first_content, 50) * 1000:.0f} / {percentile(first_content, 95) * 1000:.0f} ms",
+        'Coalesced questions': bot.COALESCER.coalesced,
+        'Answer cache hits': bot.engine().cache.hits
+    })
+
+async def bench_twitter(args, questions):
+    """Deliver every question as a mention and run the mention loop until all are answered"""
+    import twitter_bot
+    fake = FakeTwitter(questions, args.post_latency)
+    twitter_bot.twitter = fake
+
+    monitor = LoopMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    loop_task = asyncio.create_task(twitter_bot.monitor_mentions())
+    done = asyncio.create_task(fake.done.wait())
+    await asyncio.wait([loop_task, done], return_when=asyncio.FIRST_COMPLETED)
+    elapsed = time.perf_counter() - started
+    loop_task.cancel()
+    await asyncio.gather(loop_task, return_exceptions=True)
+    monitor_task.cancel()
+    twitter_bot.analytics_log.get_writer().flush()
+
+    latencies = [fake.posted_at[i] - fake.delivered_at[i] for i in fake.posted_at]
+    return lambda: summarize('Twitter mentions', latencies, elapsed, list(fake.replies.values()), monitor, rss_before, {
+        'Answer cache hits': twitter_bot.engine().cache.hits
+    })
+
+async def run(args):
+    """Start the fake OpenAI server and run the selected benchmarks"""
+    app = make_app(args.latency, args.token_delay, args.error_rate)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    os.environ['OPENAI_API_BASE'] = f"http://127.0.0.1:{port}/v1"
+
+    questions = make_questions(args.questions, args.distinct or args.questions)[:args.questions]
+    reports = []
+    try:
+        if args.only in (None, 'discord'):
+            reports.append(await bench_discord(args, questions))
+        if args.only in (None, 'twitter'):
+            reports.append(await bench_twitter(args, questions))
+    finally:
+        await runner.cleanup()
+
+    print(f"🚀 Fake OpenAI: {app['stats']['requests']} requests, {app['stats']['errors']} errors, "
+          f"latency {args.latency}s, error rate {args.error_rate:.0%}")
+    for report in reports:
+        report()
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=['discord', 'twitter'], help='Run only one benchmark')
+    parser.add_argument('--questions', type=int, default=100, help='Questions per benchmark')
+    parser.add_argument('--distinct', type=int, default=0, help='Distinct questions (default: all distinct)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Simultaneous Discord askers')
+    parser.add_argument('--latency', type=float, default=0.5, help='Fake OpenAI seconds before answering')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='Fake OpenAI seconds between streamed words')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake OpenAI requests that fail')
+    parser.add_argument('--send-latency', type=float, default=0.05, help='Fake Discord seconds per send/edit')
+    parser.add_argument('--post-latency', type=float, default=0.05, help='Fake Twitter seconds per reply')
+    parser.add_argument('--verbose', action='store_true', help="Show the bots' own log")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='taofu-bench-')
+    os.environ.update({
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY') or 'benchmark',
+        'ANSWER_CACHE_FILE': os.path.join(scratch, 'answer_cache.db'),
+        'ANALYTICS_FILE': os.path.join(scratch, 'analytics.ndjson'),
+        'REPLY_STATE_FILE': os.path.join(scratch, 'reply_state.json'),
+        'FAQ_FILE': os.path.join(scratch, 'faq_table.json'),
+        'TWITTER_POST_LIMIT': str(args.questions * 10),
+        # Every fake mention must be answered, so keep the Twitter pre-filter from treating repeats as duplicates
+        'TWITTER_DUPLICATE_WINDOW': '0',
+        'TWITTER_AUTHOR_BURST': str(args.questions),
+        'PROMPT_RELOAD_INTERVAL': '0',
+        # The bots log every question; keep the report readable
+        'LOG_LEVEL': 'INFO' if args.verbose else 'WARNING',
+        'LOG_FORMAT': os.getenv('LOG_FORMAT', 'text')
+    })
+    random.seed(0)
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
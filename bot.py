@@ -1,15 +1,30 @@
 import discord
 from discord.ext import commands
-import openai
-import json
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 import asyncio
+import logging
+import math
+import time
+import llm_client
+import analytics_log
+import metrics
+import structured_log
+import startup_profile
+from answer_engine import get_engine
+from prompt_bundle import DEFAULT_INSTRUCTIONS
+from answer_cache import normalize_question
+from conversation_memory import ConversationMemory
+from rate_limit import KeyedRateLimiter, RequestCoalescer, acquire
 
 # Load environment variables
 load_dotenv()
 
+logger = structured_log.get_logger('discord')
+
+# Log every incoming message at DEBUG (sampled by LOG_SAMPLE_RATE); off by default
+LOG_MESSAGES = os.getenv('LOG_MESSAGES', '0') == '1'
+
 # Bot configuration
 intents = discord.Intents.default()
 intents.message_content = True
@@ -19,83 +34,115 @@ intents.guild_messages = True  # Add this to read server messages
 bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
 
 # OpenAI configuration
-openai.api_key = os.getenv('OPENAI_API_KEY')
-print(f"OpenAI API Key loaded: {'Yes' if openai.api_key else 'No'}")
-if not openai.api_key:
-    print("WARNING: No OpenAI API key found! Bot will not be able to respond to questions.")
+if not os.getenv('OPENAI_API_KEY'):
+    logger.warning("No OpenAI API key found! Bot will not be able to respond to questions.")
 
-# Load knowledge base
-def load_knowledge_base():
-    try:
-        with open('knowledge.txt', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "Taofu is a decentralized ecosystem. Visit taofu.xyz for more information."
+# Analytics logging
+def log_question(user_id, username, question, response_preview, platform="Discord", **extra):
+    analytics_log.log_question(user_id, username, question, response_preview, platform, **extra)
 
-# Load system instructions
-def load_system_instructions():
-    try:
-        with open('system_instructions.txt', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return """You are the official Taofu ecosystem assistant. You help people learn about the Taofu ecosystem and provide accurate information based on the official documentation.
-
-IMPORTANT RULES:
-1. Only answer questions based on the provided Taofu knowledge base
-2. Never make up numbers, technical details, or tokenomics information
-3. If you're unsure about something, admit it and direct users to taofu.xyz
-4. Be concise and helpful
-5. Always mention you're the official Taofu assistant
-6. Encourage users to visit taofu.xyz for more information"""
-
-KNOWLEDGE_BASE = load_knowledge_base()
-SYSTEM_INSTRUCTIONS = load_system_instructions()
+def engine():
+    """Knowledge base, instructions and answer cache, shared with twitter_bot.py when run together by start.py
 
-# Analytics logging
-def log_question(user_id, username, question, response_preview, platform="Discord"):
-    try:
-        with open('analytics.json', 'r') as f:
-            analytics = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        analytics = []
-    
-    analytics.append({
-        'timestamp': datetime.now().isoformat(),
-        'user_id': str(user_id),
-        'username': username,
-        'question': question,
-        'response_preview': response_preview[:100] + "..." if len(response_preview) > 100 else response_preview,
-        'platform': platform
-    })
-    
-    with open('analytics.json', 'w') as f:
-        json.dump(analytics, f, indent=2)
+    Built on first use (or by warm_up) rather than at import.
+    """
+    return get_engine(DEFAULT_INSTRUCTIONS)
+
+# Identical questions asked at the same time share one OpenAI call
+COALESCER = RequestCoalescer()
+
+# Recent questions and answers per channel, for follow-ups (CONVERSATION_MEMORY=1)
+MEMORY = ConversationMemory()
+
+# Per-user and per-server limits on !ask
+USER_LIMITER = KeyedRateLimiter(int(os.getenv('ASK_USER_LIMIT', 5)), int(os.getenv('ASK_USER_WINDOW', 60)))
+GUILD_LIMITER = KeyedRateLimiter(int(os.getenv('ASK_GUILD_LIMIT', 30)), int(os.getenv('ASK_GUILD_WINDOW', 60)))
 
-# System prompt for OpenAI
-SYSTEM_PROMPT = f"""{SYSTEM_INSTRUCTIONS}
+async def get_ai_response(question, on_update=None, stats=None, channel_id=None):
+    """Get response from OpenAI API, sharing the answer with identical questions in flight
 
-TAOFU KNOWLEDGE BASE:
-{KNOWLEDGE_BASE}
+    If given, `on_update` is awaited with the partial answer as it streams
+    in. Only the first of several identical questions streams; the others
+    get the finished answer. If given, `stats` is filled with how the answer
+    was produced (see fetch_ai_response). With conversation memory on,
+    `channel_id` picks the conversation the question continues.
+    """
+    history = MEMORY.context(channel_id)
+    if history:
+        # A follow-up depends on its channel's conversation, so it can't share another channel's answer
+        if stats is not None:
+            stats['context_messages'] = len(history)
+        return await fetch_ai_response(question, on_update, stats, history)
 
-Remember: If asked about specific technical details, tokenomics, or information not covered in the knowledge base, direct users to taofu.xyz for the most current and accurate information."""
+    own_stats = {}
+    answer = await COALESCER.run(normalize_question(question), lambda: fetch_ai_response(question, on_update, own_stats))
+    if stats is not None:
+        # Only the question that made the call gets its usage; the rest cost nothing
+        stats.update(own_stats or {'outcome': 'coalesced'})
+    return answer
 
-async def get_ai_response(question):
-    """Get response from OpenAI API"""
+async def fetch_ai_response(question, on_update=None, stats=None, history=()):
+    """Get response from the FAQ table, the answer cache or OpenAI, in that order
+
+    If given, `stats` is filled with the outcome (faq, llm, cache or fallback)
+    and, when OpenAI was called, the route, model, latency and token usage.
+    `history` is the channel's earlier conversation; answers to follow-ups
+    are neither looked up in nor added to the answer cache.
+    """
+    stats = stats if stats is not None else {}
+    # The whole request uses one version of the prompts, even if they reload meanwhile
+    answers = engine()
+    prompts = answers.prompts.bundle
+    precomputed = answers.faq.lookup(question, 'discord', prompts.version)
+    if precomputed:
+        stats['outcome'] = 'faq'
+        return precomputed
+
+    cached = None if history else await asyncio.to_thread(answers.cache.get, question, 'discord', prompts.version)
+    if cached:
+        logger.debug("Answer cache hit", extra={'hits': answers.cache.hits, 'misses': answers.cache.misses})
+        stats['outcome'] = 'cache'
+        return cached
+
+    messages = [
+        {"role": "system", "content": prompts.system_prompt_for(question)},
+        *history,
+        {"role": "user", "content": question}
+    ]
+    # Simple FAQ-style questions go to the fast model, the rest to GPT-4
+    route = answers.router.route(question, prompts.index)
+    stats['route'] = route.name
+    started = time.perf_counter()
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": question}
-            ],
-            max_tokens=1000,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
+        if on_update:
+            answer = ''
+            async for text in llm_client.stream_chat_completion(model=route.model, messages=messages, max_tokens=1000, temperature=0.7, usage=stats):
+                answer += text
+                await on_update(answer)
+            answer = answer.strip()
+        else:
+            answer = await llm_client.chat_completion(model=route.model, messages=messages, max_tokens=1000, temperature=0.7, usage=stats)
     except Exception as e:
-        print(f"OpenAI API error: {e}")
+        if isinstance(e, llm_client.CircuitOpenError):
+            # The breaker logs when it opens; no need to log every rejected question
+            logger.debug("OpenAI unavailable, circuit breaker open")
+        else:
+            logger.error("OpenAI API error: %s", e, extra={'route': route.name, 'model': route.model})
+        answers.router.observe(route, started)
+        # Fall back to an FAQ answer from an older knowledge base if there is one
+        stale = answers.faq.lookup(question, 'discord', None)
+        if stale:
+            stats['outcome'] = 'degraded'
+            return stale
+        stats['outcome'] = 'fallback'
         return "I'm having trouble connecting to my knowledge base right now. Please try again later or visit taofu.xyz for information."
 
+    answers.router.observe(route, started, answer)
+    stats['outcome'] = 'llm'
+    if not history:
+        await asyncio.to_thread(answers.cache.put, question, answer, 'discord', prompts.version)
+    return answer
+
 def split_message(message, max_length=2000):
     """Split long messages to fit Discord's character limit"""
     if len(message) <= max_length:
@@ -117,20 +164,132 @@ def split_message(message, max_length=2000):
     
     return parts
 
+DISCORD_SEND_LATENCY = metrics.DISCORD_SEND_LATENCY.labels('send')
+DISCORD_EDIT_LATENCY = metrics.DISCORD_SEND_LATENCY.labels('edit')
+
+class StreamingReply:
+    """Shows an answer while it streams in by editing the first embed
+
+    Edits are throttled to DISCORD_EDIT_INTERVAL seconds to stay within
+    Discord's rate limits. Text past the split_message limit rolls over
+    into follow-up messages, just like a complete answer.
+    """
+
+    def __init__(self, ctx, interval=None):
+        self.ctx = ctx
+        self.interval = interval if interval is not None else float(os.getenv('DISCORD_EDIT_INTERVAL', 1.0))
+        self.text = ''
+        self.messages = []  # Sent messages, one per part
+        self.shown = []  # Text currently shown in each message
+        self.started_at = time.monotonic()
+        self.first_content_at = None
+        self._changed = asyncio.Event()
+        self._finished = False
+        self._task = None
+
+    @property
+    def time_to_first_content(self):
+        """Seconds from the question to the first visible answer text"""
+        if self.first_content_at is None:
+            return None
+        return self.first_content_at - self.started_at
+
+    async def update(self, text):
+        """Record the partial answer; it is shown on the next throttled edit"""
+        self.text = text
+        self._changed.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def finish(self, text):
+        """Show the complete answer"""
+        self.text = text
+        self._finished = True
+        self._changed.set()
+        if self._task is None:
+            await self._render()
+        else:
+            await self._task
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            await self._render()
+            if self._finished:
+                return
+            await asyncio.sleep(self.interval)
+
+    async def _render(self):
+        if not self.text.strip():
+            return
+        parts = split_message(self.text)
+        for i, part in enumerate(parts):
+            if i < len(self.shown) and self.shown[i] == part:
+                continue
+            if i == 0:
+                embed = discord.Embed(
+                    title="🤖 Taofu Assistant",
+                    description=part,
+                    color=0x00ff00
+                )
+                embed.set_footer(text=f"Asked by {self.ctx.author.name}")
+                if self.messages:
+                    with DISCORD_EDIT_LATENCY.time():
+                        await self.messages[0].edit(embed=embed)
+                else:
+                    with DISCORD_SEND_LATENCY.time():
+                        self.messages.append(await self.ctx.send(embed=embed))
+                    self.first_content_at = time.monotonic()
+            elif i < len(self.messages):
+                with DISCORD_EDIT_LATENCY.time():
+                    await self.messages[i].edit(content=part)
+            else:
+                with DISCORD_SEND_LATENCY.time():
+                    self.messages.append(await self.ctx.send(part))
+            if i < len(self.shown):
+                self.shown[i] = part
+            else:
+                self.shown.append(part)
+        # A shorter final text (the fallback after a failed stream) leaves no stale follow-ups
+        await self._delete_from(len(parts))
+
+    async def _delete_from(self, index):
+        while len(self.messages) > index:
+            message = self.messages.pop()
+            del self.shown[len(self.messages):]
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                logger.warning("Could not delete a partial answer message", extra={'message_id': message.id})
+
+    async def abandon(self):
+        """Stop updating and remove everything shown so far, after an error"""
+        if self._task is not None:
+            self._task.cancel()
+        await self._delete_from(0)
+
+async def warm_up():
+    """Build the prompts and import the OpenAI client while the gateway connects"""
+    await asyncio.to_thread(engine)
+    await asyncio.to_thread(llm_client.warm_up)
+    engine().start_reloader()
+    startup_profile.milestone('discord warm')
+
+@bot.event
+async def setup_hook():
+    # Runs once before connecting, unlike on_ready which fires again on every reconnect
+    bot.warm_up_task = asyncio.create_task(warm_up())
+
 @bot.event
 async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
-    print(f'Bot is in {len(bot.guilds)} guilds')
-    print(f'Bot prefix: {bot.command_prefix}')
-    print(f'Available commands: {[cmd.name for cmd in bot.commands]}')
-    
-    # Test command registration
-    for cmd in bot.commands:
-        print(f"Command '{cmd.name}' registered with aliases: {cmd.aliases}")
-        print(f"Command '{cmd.name}' help: {cmd.help}")
-    
-    # Debug intents
-    print(f"Intents: guilds={bot.intents.guilds}, guild_messages={bot.intents.guild_messages}, message_content={bot.intents.message_content}")
+    startup_profile.milestone('discord ready')
+    logger.info("Connected to Discord as %s", bot.user, extra={
+        'guilds': len(bot.guilds),
+        'prefix': bot.command_prefix,
+        'commands': [cmd.name for cmd in bot.commands],
+        'message_content_intent': bot.intents.message_content
+    })
     
     # Set bot status
     await bot.change_presence(activity=discord.Activity(
@@ -141,36 +300,55 @@ async def on_ready():
 @bot.command(name='test')
 async def test_command(ctx):
     """Test command to see if commands work"""
-    print(f"Test command triggered by {ctx.author.name}!")
+    logger.debug("Test command", extra={'user': ctx.author.name})
     try:
         await ctx.send("Test command works! 🎉")
-        print("Test message sent successfully!")
-    except Exception as e:
-        print(f"Error sending test message: {e}")
+    except Exception:
+        logger.exception("Error sending test message")
         await ctx.send("Test command failed!")
 
 @bot.command(name='ping')
 async def ping_command(ctx):
     """Simple ping command"""
-    print(f"Ping command triggered by {ctx.author.name}!")
-    print(f"Ping command context: guild={ctx.guild}, channel={ctx.channel}")
+    logger.debug("Ping command", extra={'user': ctx.author.name, 'guild': str(ctx.guild), 'channel': str(ctx.channel)})
     await ctx.send("Pong! 🏓")
 
 @bot.command(name='ask')
 async def ask_question(ctx, *, question):
     """Ask a question about the Taofu ecosystem"""
-    print(f"Ask command triggered by {ctx.author.name}: {question}")
+    logger.debug("Ask command", extra={'user_id': ctx.author.id, 'question': question})
     if not question.strip():
         await ctx.send("Please provide a question! Use `!taofu ask <your question>`")
         return
     
+    # Check the user and server haven't used up their question allowance
+    retry_after = acquire(
+        (USER_LIMITER, ctx.author.id),
+        (GUILD_LIMITER, ctx.guild.id if ctx.guild else None)
+    )
+    if retry_after:
+        logger.info("Rate limited", extra={'user_id': ctx.author.id, 'retry_after': round(retry_after, 1)})
+        await ctx.send(f"You're asking questions too quickly. Please try again in {math.ceil(retry_after)} seconds.")
+        return
+    
     # Show typing indicator
-    print("Getting AI response...")
     async with ctx.typing():
+        # Stream the AI response into the reply as it is generated
+        reply = StreamingReply(ctx)
         try:
-            # Get AI response
-            response = await get_ai_response(question)
-            print(f"AI response received: {response[:100]}...")
+            stats = {}
+            response = await get_ai_response(question, on_update=reply.update, stats=stats, channel_id=ctx.channel.id)
+            await reply.finish(response)
+            if stats.get('outcome') != 'fallback':
+                MEMORY.record(ctx.channel.id, question, response)
+            first_content = reply.time_to_first_content
+            startup_profile.milestone('first discord answer')
+            logger.info("Question answered", extra={
+                'user_id': ctx.author.id,
+                'guild_id': ctx.guild.id if ctx.guild else None,
+                'time_to_first_content': round(first_content, 3) if first_content is not None else None,
+                **stats
+            })
             
             # Log the question
             log_question(
@@ -178,33 +356,20 @@ async def ask_question(ctx, *, question):
                 username=ctx.author.name,
                 question=question,
                 response_preview=response,
-                platform="Discord"
+                platform="Discord",
+                time_to_first_content=round(first_content, 3) if first_content is not None else None,
+                **stats
             )
-            
-            # Split response if too long
-            message_parts = split_message(response)
-            
-            # Send response
-            for i, part in enumerate(message_parts):
-                if i == 0:
-                    embed = discord.Embed(
-                        title="🤖 Taofu Assistant",
-                        description=part,
-                        color=0x00ff00
-                    )
-                    embed.set_footer(text=f"Asked by {ctx.author.name}")
-                    await ctx.send(embed=embed)
-                else:
-                    await ctx.send(part)
                     
-        except Exception as e:
-            print(f"Error processing question: {e}")
+        except Exception:
+            logger.exception("Error processing question")
+            await reply.abandon()
             await ctx.send("Sorry, I encountered an error. Please try again later or visit taofu.xyz for information.")
 
 @bot.command(name='taofu_help')
 async def help_command(ctx):
     """Show help information"""
-    print(f"Help command triggered by {ctx.author.name}")
+    logger.debug("Help command", extra={'user': ctx.author.name})
     try:
         embed = discord.Embed(
             title="🤖 Taofu Assistant Help",
@@ -235,11 +400,9 @@ async def help_command(ctx):
         )
         
         embed.set_footer(text="Official Taofu Assistant")
-        print("Sending help embed...")
         await ctx.send(embed=embed)
-        print("Help embed sent successfully!")
-    except Exception as e:
-        print(f"Error in help command: {e}")
+    except Exception:
+        logger.exception("Error in help command")
         await ctx.send("Sorry, I encountered an error. Please try again later.")
 
 @bot.event
@@ -249,56 +412,57 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # Enhanced diagnostic logging
-    print(f"on_message: author={message.author}, guild={message.guild}, channel={message.channel}, content={message.content!r}")
-    print(f"Channel type: {message.channel.type}")
-    print(f"Guild: {message.guild.name if message.guild else 'DM'}")
+    # Every message in every guild passes through here, so only log when asked
+    if LOG_MESSAGES and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Message received", extra=structured_log.sampled(
+            author_id=message.author.id,
+            guild_id=message.guild.id if message.guild else None,
+            channel_id=message.channel.id,
+            channel_type=str(message.channel.type),
+            content=message.content
+        ))
     
     # Test if bot can send messages
     if message.content.lower() == "test":
         try:
             await message.channel.send("Bot is working! 🎉")
-            print("Successfully sent test message")
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error sending test message")
     
     # Let Discord.py handle command processing naturally
     try:
         await bot.process_commands(message)
-        print("Command processing completed")
-    except Exception as e:
-        print(f"Error processing commands: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error processing commands")
 
 @bot.event
 async def on_command_error(ctx, error):
     """Handle command errors"""
-    print(f"Command error: {error}")
     if isinstance(error, commands.CommandNotFound):
-        print(f"Command not found: {ctx.message.content}")
+        logger.debug("Command not found", extra={'content': ctx.message.content})
         # Only respond to commands that start with our prefix
         if ctx.message.content.startswith(bot.command_prefix):
             await ctx.send("Unknown command. Use `!taofu taofu_help` to see available commands.")
     elif isinstance(error, commands.MissingRequiredArgument):
-        print(f"Missing argument: {error}")
+        logger.info("Missing argument: %s", error)
         await ctx.send("Please provide all required arguments. Use `!taofu taofu_help` for more information.")
     else:
-        print(f"Other error: {error}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Command error: %s", error, exc_info=error)
         await ctx.send("An error occurred. Please try again later.")
 
 # Run the bot
 if __name__ == "__main__":
     token = os.getenv('DISCORD_TOKEN')
     if not token:
-        print("Error: DISCORD_TOKEN not found in environment variables")
+        logger.error("DISCORD_TOKEN not found in environment variables")
         exit(1)
     
+    if os.getenv('METRICS_PORT'):
+        import app
+        app.start_background()
+    
     try:
-        bot.run(token)
-    except Exception as e:
-        print(f"Error starting bot: {e}") 
\ No newline at end of file
+        # Logging is already set up by structured_log; don't let discord.py add its own handler
+        bot.run(token, log_handler=None)
+    except Exception:
+        logger.exception("Error starting bot") 
\ No newline at end of file
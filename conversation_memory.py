@@ -0,0 +1,170 @@
+"""
+Conversation memory for `!ask`
+Keeps the last few questions and answers of each channel or thread so
+follow-ups ("and how do I stake it?") can be answered without the user
+repeating themselves. Turns that fall out of a channel's ring buffer are
+folded into a short rolling summary by the fast model in the background, so
+the context sent with a question stays the same size however long the
+thread runs.
+
+Memory use is bounded too: each channel holds at most CONVERSATION_TURNS
+turns of capped length plus one capped summary, channels idle for
+CONVERSATION_IDLE seconds are forgotten, and at most
+CONVERSATION_MAX_CHANNELS are kept, least recently used first out.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+import llm_client
+import metrics
+
+# Longest question, answer and summary kept, in characters
+QUESTION_CHARS = 300
+ANSWER_CHARS = 800
+SUMMARY_CHARS = 1000
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between users and the Taofu assistant.
+Merge the new exchanges into the summary. Keep what the users asked about, the facts given in answers and anything later questions may refer back to. Drop greetings and repetition.
+Reply with the updated summary only, in under 120 words."""
+
+SUMMARIES_OK = metrics.CONVERSATION_SUMMARIES.labels('ok')
+SUMMARIES_ERROR = metrics.CONVERSATION_SUMMARIES.labels('error')
+
+logger = logging.getLogger('taofu.memory')
+
+def _clip(text, limit):
+    text = text.strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+class Turn:
+    """One question and its answer"""
+    __slots__ = ('question', 'answer')
+
+    def __init__(self, question, answer):
+        self.question = _clip(question, QUESTION_CHARS)
+        self.answer = _clip(answer, ANSWER_CHARS)
+
+class Conversation:
+    """Recent turns of one channel plus a summary of everything before them"""
+    __slots__ = ('turns', 'pending', 'summary', 'updated', 'summarizing')
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.pending = deque(maxlen=max_turns)  # Evicted turns not yet in the summary
+        self.summary = ''
+        self.updated = time.monotonic()
+        self.summarizing = False
+
+    def add(self, turn):
+        if len(self.turns) == self.turns.maxlen:
+            self.pending.append(self.turns[0])
+        self.turns.append(turn)
+        self.updated = time.monotonic()
+
+    def messages(self):
+        """Chat messages carrying this conversation, oldest first"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation in this channel: {self.summary}"})
+        for turn in list(self.pending) + list(self.turns):
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+class ConversationMemory:
+    """Bounded per-channel conversation context
+
+    Disabled unless CONVERSATION_MEMORY=1; while disabled context() is
+    always empty and record() does nothing.
+    """
+
+    def __init__(self, enabled=None, max_turns=None, idle_ttl=None, max_channels=None, summary_model=None):
+        self.enabled = enabled if enabled is not None else os.getenv('CONVERSATION_MEMORY', '0') == '1'
+        self.max_turns = max_turns if max_turns is not None else int(os.getenv('CONVERSATION_TURNS', 4))
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.getenv('CONVERSATION_IDLE', 1800))
+        self.max_channels = max_channels if max_channels is not None else int(os.getenv('CONVERSATION_MAX_CHANNELS', 5000))
+        self.summary_model = summary_model or os.getenv('CONVERSATION_SUMMARY_MODEL', os.getenv('FAST_MODEL', 'gpt-4o-mini'))
+        self.conversations = OrderedDict()  # key -> Conversation, least recently used first
+        self.pruned_at = time.monotonic()
+        self._tasks = set()
+        metrics.CONVERSATIONS_ACTIVE.set_function(lambda: len(self.conversations))
+
+    def _get(self, key, now):
+        conversation = self.conversations.get(key)
+        if conversation is not None and now - conversation.updated > self.idle_ttl:
+            del self.conversations[key]
+            return None
+        return conversation
+
+    def context(self, key):
+        """Messages to send ahead of a new question in channel `key`"""
+        if not self.enabled or key is None:
+            return []
+        conversation = self._get(key, time.monotonic())
+        return conversation.messages() if conversation else []
+
+    def record(self, key, question, answer):
+        """Remember an answered question, summarizing turns that no longer fit"""
+        if not self.enabled or key is None or self.max_turns <= 0:
+            return
+        now = time.monotonic()
+        conversation = self._get(key, now)
+        if conversation is None:
+            if len(self.conversations) >= self.max_channels or now - self.pruned_at > self.idle_ttl:
+                self.prune(now)
+            conversation = self.conversations[key] = Conversation(self.max_turns)
+        else:
+            self.conversations.move_to_end(key)
+        conversation.add(Turn(question, answer))
+
+        if conversation.pending and not conversation.summarizing:
+            conversation.summarizing = True
+            task = asyncio.create_task(self._summarize(conversation))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def prune(self, now=None):
+        """Forget idle conversations, then the least recently used ones over the limit"""
+        now = now if now is not None else time.monotonic()
+        self.pruned_at = now
+        for key, conversation in list(self.conversations.items()):
+            if now - conversation.updated > self.idle_ttl:
+                del self.conversations[key]
+        while len(self.conversations) >= self.max_channels:
+            self.conversations.popitem(last=False)
+
+    async def _summarize(self, conversation):
+        """Fold a conversation's evicted turns into its summary
+
+        On failure the turns stay pending (and in the context) until the next
+        question retries; if they keep failing the oldest are dropped.
+        """
+        try:
+            while conversation.pending:
+                turns = list(conversation.pending)
+                exchanges = '\n'.join(f"Q: {turn.question}\nA: {turn.answer}" for turn in turns)
+                summary = await llm_client.chat_completion(
+                    model=self.summary_model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_PROMPT},
+                        {"role": "user", "content": f"Summary so far: {conversation.summary or '(none)'}\n\nNew exchanges:\n{exchanges}"}
+                    ],
+                    max_tokens=200,
+                    temperature=0.3
+                )
+                conversation.summary = _clip(summary, SUMMARY_CHARS)
+                # Turns evicted while we waited are still pending for the next round
+                for turn in turns:
+                    if conversation.pending and conversation.pending[0] is turn:
+                        conversation.pending.popleft()
+                SUMMARIES_OK.inc()
+        except Exception as e:
+            SUMMARIES_ERROR.inc()
+            if not isinstance(e, llm_client.CircuitOpenError):
+                logger.warning("Error summarizing conversation: %s", e)
+        finally:
+            conversation.summarizing = False
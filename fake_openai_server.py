@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API
+Use it to exercise the bots without an API key or spending credits:
+
+    python fake_openai_server.py --port 8099 --latency 1.5
+    OPENAI_API_BASE=http://127.0.0.1:8099/v1 OPENAI_API_KEY=test python bot.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+def make_app(latency=0.5, token_delay=0.02, error_rate=0.0):
+    """Create the fake API app answering after `latency` seconds
+
+    Streamed answers send their first word after `latency` seconds and each
+    following word `token_delay` seconds later. A fraction `error_rate` of
+    requests fail with a 500 error instead.
+    """
+    app = web.Application()
+    app['latency'] = latency
+    app['token_delay'] = token_delay
+    app['error_rate'] = error_rate
+    app['stats'] = {'requests': 0, 'errors': 0}
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    return app
+
+async def chat_completions(request):
+    """Answer a chat completion request with a canned reply"""
+    body = await request.json()
+    stats = request.app['stats']
+    stats['requests'] += 1
+    await asyncio.sleep(request.app['latency'])
+
+    if random.random() < request.app['error_rate']:
+        stats['errors'] += 1
+        return web.json_response({
+            'error': {'message': 'The server had an error while processing your request.', 'type': 'server_error'}
+        }, status=500)
+
+    question = body['messages'][-1]['content']
+    answer = f"This is a test answer about Taofu for: {question}. Visit taofu.xyz for more information."
+    if body.get('stream'):
+        return await stream_answer(request, body, answer)
+
+    prompt_tokens = sum(len(m['content']) for m in body['messages']) // 4
+    completion_tokens = len(answer) // 4
+    return web.json_response({
+        'id': f"chatcmpl-fake-{stats['requests']}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'gpt-4'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': answer},
+            'finish_reason': 'stop'
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    })
+
+async def stream_answer(request, body, answer):
+    """Send the answer word by word as server-sent events"""
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+
+    words = answer.split(' ')
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(request.app['token_delay'])
+        chunk = {
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4'),
+            'choices': [{'index': 0, 'delta': {'content': word if i == 0 else ' ' + word}, 'finish_reason': None}]
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+def main():
+    """Run the fake server"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds to wait before answering')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Seconds between streamed words')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with a 500 error')
+    args = parser.parse_args()
+
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1 (latency {args.latency}s, error rate {args.error_rate:.0%})")
+    web.run_app(make_app(args.latency, args.token_delay, args.error_rate), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
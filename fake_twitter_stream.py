@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Twitter v2 filtered stream
+Serves the stream rules endpoints and the stream itself, with keep-alives,
+so the bot's stream ingestion (TWITTER_INGEST=stream) can be exercised
+without stream access:
+
+    python fake_twitter_stream.py --port 8098 --rate 0.2
+    TWITTER_INGEST=stream TWITTER_STREAM_URL=http://127.0.0.1:8098 TWITTER_BEARER_TOKEN=test python twitter_bot.py
+
+Mentions are generated every 1/--rate seconds, or posted by hand:
+
+    curl -X POST http://127.0.0.1:8098/fake/mentions -d '{"text": "@taofu_bot what is TPN?"}'
+
+--drop-after closes each connection after that many seconds and
+--fail-connects answers the first connection attempts with --fail-status,
+to exercise reconnects and the fallback to polling.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from aiohttp import web
+
+QUESTIONS = [
+    "what is Taofu?",
+    "how does TPN work?",
+    "how do I mine on the network?",
+    "how does staking work?",
+    "when is the next vesting unlock?"
+]
+
+def make_app(keepalive=20.0, drop_after=None, fail_connects=0, fail_status=503):
+    """Create the fake stream app
+
+    Connections get a keep-alive line every `keepalive` seconds and are
+    closed after `drop_after` seconds if set. The first `fail_connects`
+    connection attempts are answered with `fail_status`.
+    """
+    app = web.Application()
+    app['keepalive'] = keepalive
+    app['drop_after'] = drop_after
+    app['fail_connects'] = fail_connects
+    app['fail_status'] = fail_status
+    app['rules'] = []
+    app['listeners'] = set()
+    app['ids'] = itertools.count(int(time.time() * 1000) << 22)
+    app['stats'] = {'connects': 0, 'rejected': 0, 'delivered': 0}
+    app.router.add_get('/2/tweets/search/stream/rules', get_rules)
+    app.router.add_post('/2/tweets/search/stream/rules', change_rules)
+    app.router.add_get('/2/tweets/search/stream', stream)
+    app.router.add_post('/fake/mentions', post_mention)
+    return app
+
+def authorized(request):
+    return request.headers.get('Authorization', '').startswith('Bearer ')
+
+async def get_rules(request):
+    if not authorized(request):
+        return web.json_response({'title': 'Unauthorized'}, status=401)
+    rules = request.app['rules']
+    return web.json_response({'data': rules, 'meta': {'result_count': len(rules)}} if rules else {'meta': {'result_count': 0}})
+
+async def change_rules(request):
+    if not authorized(request):
+        return web.json_response({'title': 'Unauthorized'}, status=401)
+    body = await request.json()
+    app = request.app
+    if 'delete' in body:
+        ids = set(body['delete'].get('ids', []))
+        app['rules'] = [rule for rule in app['rules'] if rule['id'] not in ids]
+    added = []
+    for rule in body.get('add', []):
+        added.append({'id': str(next(app['ids'])), 'value': rule['value'], 'tag': rule.get('tag')})
+    app['rules'].extend(added)
+    return web.json_response({'data': added, 'meta': {'summary': {'created': len(added)}}})
+
+def publish(app, text, username='fakeuser', user_id=None):
+    """Send a tweet to every open stream connection"""
+    user_id = str(user_id or random.randint(1000, 999999))
+    event = {
+        'data': {'id': str(next(app['ids'])), 'text': text, 'author_id': user_id},
+        'includes': {'users': [{'id': user_id, 'username': username}]},
+        'matching_rules': [{'id': rule['id'], 'tag': rule['tag']} for rule in app['rules']]
+    }
+    for queue in app['listeners']:
+        queue.put_nowait(event)
+    app['stats']['delivered'] += 1
+    return event
+
+async def post_mention(request):
+    """Publish a tweet given as {"text": ..., "username": ...}"""
+    body = await request.json()
+    event = publish(request.app, body['text'], body.get('username', 'fakeuser'), body.get('user_id'))
+    return web.json_response(event)
+
+async def stream(request):
+    """Stream published tweets as newline-delimited JSON with keep-alives"""
+    app = request.app
+    if not authorized(request):
+        return web.json_response({'title': 'Unauthorized'}, status=401)
+    if app['fail_connects'] > 0:
+        app['fail_connects'] -= 1
+        app['stats']['rejected'] += 1
+        return web.json_response({'title': 'Service Unavailable'}, status=app['fail_status'])
+
+    app['stats']['connects'] += 1
+    response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    await response.prepare(request)
+    queue = asyncio.Queue()
+    app['listeners'].add(queue)
+    deadline = time.monotonic() + app['drop_after'] if app['drop_after'] else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            timeout = app['keepalive']
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - time.monotonic(), 0))
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+                await response.write(json.dumps(event).encode('utf-8') + b'\r\n')
+            except asyncio.TimeoutError:
+                await response.write(b'\r\n')
+    except ConnectionResetError:
+        pass
+    finally:
+        app['listeners'].discard(queue)
+    return response
+
+async def generate(app, rate, bot_username):
+    """Publish a random question mentioning the bot about `rate` times a second"""
+    while True:
+        await asyncio.sleep(random.expovariate(rate))
+        publish(app, f"@{bot_username} {random.choice(QUESTIONS)}", f"user{random.randint(1, 50)}")
+
+def main():
+    """Run the fake server"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--bot-username', default='taofu_bot', help='Account the generated mentions are addressed to')
+    parser.add_argument('--rate', type=float, default=0.0, help='Generated mentions per second (0 for none)')
+    parser.add_argument('--keepalive', type=float, default=20.0, help='Seconds between keep-alive lines')
+    parser.add_argument('--drop-after', type=float, default=None, help='Close each connection after this many seconds')
+    parser.add_argument('--fail-connects', type=int, default=0, help='Reject this many connection attempts first')
+    parser.add_argument('--fail-status', type=int, default=503, help='HTTP status for rejected connections (e.g. 429, 403)')
+    args = parser.parse_args()
+
+    app = make_app(args.keepalive, args.drop_after, args.fail_connects, args.fail_status)
+    if args.rate > 0:
+        async def start_generator(app):
+            app['generator'] = asyncio.create_task(generate(app, args.rate, args.bot_username))
+        app.on_startup.append(start_generator)
+
+    print(f"Fake Twitter stream on http://{args.host}:{args.port} ({args.rate} mentions/s)")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Precomputed answers to the most frequently asked questions
+An offline job groups the questions in the analytics log by their key terms,
+answers the top groups against the current knowledge base and writes them to
+faq_table.json along with the knowledge base version they were generated
+from. Both bots look questions up here before the answer cache or OpenAI,
+matching on the normalized question first and then on term overlap among
+entries asking the same kind of question (what, how, when...), so
+rephrasings of a common question are answered in microseconds.
+
+The table is only used while its version matches the loaded prompts. When
+knowledge.txt or system_instructions.txt change, a running bot regenerates it
+in the background (see AnswerEngine).
+
+Run `python faq_table.py build` to generate the table, `python faq_table.py
+show` to list it and `python faq_table.py match "question"` to test matching.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+import analytics_log
+import llm_client
+import metrics
+from answer_cache import normalize_question
+from knowledge_index import tokenize
+
+try:
+    import fcntl
+except ImportError:  # Windows: rebuilds are not coordinated between processes
+    fcntl = None
+
+FAQ_FILE = 'faq_table.json'
+
+# max_tokens for each platform's answers, as the bots use them
+PLATFORM_MAX_TOKENS = {'discord': 1000, 'twitter': 200}
+
+FAQ_HITS = metrics.FAQ_LOOKUPS.labels('hit')
+FAQ_MISSES = metrics.FAQ_LOOKUPS.labels('miss')
+
+logger = logging.getLogger('taofu.faq')
+
+def get_faq_file():
+    """Path of the FAQ table"""
+    return os.getenv('FAQ_FILE', FAQ_FILE)
+
+# Stopwords for retrieval, but they decide what a question asks ("when" vs "how" does vesting unlock)
+QUESTION_WORDS = frozenset({'what', 'how', 'when', 'where', 'why', 'who', 'which'})
+
+def question_terms(question):
+    """Stemmed key terms of a question plus its question words, ignoring order, repeats and stopwords"""
+    words = normalize_question(question).split()
+    return frozenset(tokenize(question)) | QUESTION_WORDS.intersection(words)
+
+def similarity(a, b):
+    """Jaccard overlap of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class FaqTable:
+    """In-memory view of faq_table.json, reloaded when the file changes"""
+
+    def __init__(self, path=None, threshold=None, refresh_interval=5.0):
+        self.path = path or get_faq_file()
+        self.threshold = threshold if threshold is not None else float(os.getenv('FAQ_MATCH_THRESHOLD', 0.75))
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self.entries = []
+        self.exact = {}  # normalized question -> entry
+        self.postings = {}  # term -> entries containing it
+        self.signature = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        self.signature = self._signature()
+        self.checked_at = time.monotonic()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            table = {}
+        except json.JSONDecodeError:
+            logger.warning("Error reading %s, ignoring FAQ table", self.path)
+            table = {}
+
+        entries = table.get('entries', [])
+        exact = {}
+        postings = {}
+        for entry in entries:
+            entry['terms'] = question_terms(entry['question'])
+            for variant in [entry['question']] + entry.get('variants', []):
+                exact.setdefault(normalize_question(variant), entry)
+            for term in entry['terms']:
+                postings.setdefault(term, []).append(entry)
+
+        # Swap in with single assignments so lookups never see a half-built table
+        self.exact, self.postings, self.entries = exact, postings, entries
+        self.version = table.get('version')
+
+    def refresh(self):
+        """Reload if the file changed, checking at most every refresh_interval seconds"""
+        now = time.monotonic()
+        if now - self.checked_at < self.refresh_interval:
+            return
+        self.checked_at = now
+        if self._signature() != self.signature:
+            self._load()
+
+    def match(self, question):
+        """The entry answering a question, or None"""
+        entry = self.exact.get(normalize_question(question))
+        if entry is not None:
+            return entry
+
+        terms = question_terms(question)
+        best, best_score = None, self.threshold
+        seen = set()
+        for term in terms:
+            for candidate in self.postings.get(term, ()):
+                if id(candidate) in seen:
+                    continue
+                seen.add(id(candidate))
+                if terms & QUESTION_WORDS != candidate['terms'] & QUESTION_WORDS:
+                    # Same topic, different question
+                    continue
+                score = similarity(terms, candidate['terms'])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return best
+
+    def lookup(self, question, platform, version):
+        """Precomputed answer for a question on a platform, or None
+
+        Only answers generated from knowledge base `version` are used; None
+        accepts any version, for when OpenAI is unavailable and an older
+        answer beats an apology.
+        """
+        self.refresh()
+        entry = self.match(question) if version is None or self.version == version else None
+        answer = entry['answers'].get(platform) if entry else None
+        if answer:
+            self.hits += 1
+            FAQ_HITS.inc()
+        else:
+            self.misses += 1
+            FAQ_MISSES.inc()
+        return answer
+
+def mine_questions(top=None, min_count=None, since=None, path=None):
+    """The most frequently asked question groups in the analytics log
+
+    Questions with the same key terms form a group. Returns (question,
+    variants, count) for the `top` largest groups, where `question` is the
+    most common wording and `variants` the other common wordings.
+    """
+    top = top if top is not None else int(os.getenv('FAQ_SIZE', 50))
+    min_count = min_count if min_count is not None else int(os.getenv('FAQ_MIN_COUNT', 3))
+    path = path or analytics_log.get_analytics_file()
+    if not os.path.exists(path):
+        return []
+
+    # First pass: count each group
+    groups = Counter()
+    for item in analytics_log.read_records(path, since=since):
+        terms = question_terms(item['question'])
+        if terms:
+            groups[terms] += 1
+    largest = {terms: count for terms, count in groups.most_common(top) if count >= min_count}
+    del groups
+
+    # Second pass: the wordings used for the largest groups
+    wordings = {terms: Counter() for terms in largest}
+    for item in analytics_log.read_records(path, since=since):
+        terms = question_terms(item['question'])
+        if terms in wordings:
+            wordings[terms][item['question'].strip()] += 1
+
+    mined = []
+    for terms, count in sorted(largest.items(), key=lambda kv: kv[1], reverse=True):
+        # Wordings differing only in case or punctuation already match exactly
+        common = {}
+        for question, _ in wordings[terms].most_common():
+            common.setdefault(normalize_question(question), question)
+            if len(common) == 5:
+                break
+        question, *variants = common.values()
+        mined.append((question, variants, count))
+    return mined
+
+async def generate_answers(bundle, question, model):
+    """Answer one question for every platform, skipping platforms that fail"""
+    answers = {}
+    for platform, max_tokens in PLATFORM_MAX_TOKENS.items():
+        try:
+            answers[platform] = await llm_client.chat_completion(
+                model=model,
+                messages=[
+                    {"role": "system", "content": bundle.system_prompt_for(question)},
+                    {"role": "user", "content": question}
+                ],
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+        except Exception as e:
+            logger.warning("Error generating FAQ answer: %s", e, extra={'question': question, 'platform': platform})
+    return answers
+
+def write_table(entries, version, path=None):
+    """Replace the FAQ table atomically"""
+    path = path or get_faq_file()
+    table = {
+        'version': version,
+        'generated_at': datetime.now().isoformat(),
+        'entries': entries
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(table, f, indent=2)
+    os.replace(tmp_path, path)
+
+async def build(bundle, path=None, top=None, since=None, model=None, concurrency=None):
+    """Mine the top questions and answer them against `bundle`
+
+    Answers are generated concurrently, up to OPENAI_MAX_CONCURRENCY at a
+    time, or `concurrency` questions at a time if that is lower. Returns the
+    number of entries written.
+    """
+    path = path or get_faq_file()
+    model = model or os.getenv('FAQ_MODEL', os.getenv('STRONG_MODEL', 'gpt-4'))
+    started = time.perf_counter()
+    mined = await asyncio.to_thread(mine_questions, top, None, since)
+    limit = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def answer(question):
+        if limit is None:
+            return await generate_answers(bundle, question, model)
+        async with limit:
+            return await generate_answers(bundle, question, model)
+
+    results = await asyncio.gather(*(answer(question) for question, _, _ in mined))
+
+    entries = [
+        {'question': question, 'variants': variants, 'count': count, 'answers': answers}
+        for (question, variants, count), answers in zip(mined, results)
+        if answers
+    ]
+    await asyncio.to_thread(write_table, entries, bundle.version, path)
+    logger.info("Built FAQ table", extra={
+        'entries': len(entries),
+        'version': bundle.version,
+        'model': model,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+    return len(entries)
+
+async def rebuild_if_stale(bundle, table):
+    """Regenerate the table for a new knowledge base version
+
+    Only one process rebuilds at a time; the others pick up its table when
+    they next refresh. The rebuild runs alongside live questions, so it only
+    takes FAQ_REBUILD_CONCURRENCY of the OpenAI slots. Returns True if this
+    call rebuilt it.
+    """
+    with open(f"{table.path}.lock", 'w') as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        # Another process may have finished a rebuild before we got the lock
+        table.checked_at = 0.0
+        table.refresh()
+        if table.version == bundle.version:
+            return False
+        await build(bundle, table.path, concurrency=int(os.getenv('FAQ_REBUILD_CONCURRENCY', 1)))
+        table.checked_at = 0.0
+        table.refresh()
+        return True
+
+def main():
+    """Build, list or test the FAQ table"""
+    parser = argparse.ArgumentParser(description='Precomputed FAQ answers for the Taofu bots')
+    subcommands = parser.add_subparsers(dest='command')
+    build_parser = subcommands.add_parser('build', help='Answer the most common questions in the analytics log')
+    build_parser.add_argument('--top', type=int, default=None, help='Question groups to answer (default: FAQ_SIZE or 50)')
+    build_parser.add_argument('--since', help='Only mine questions from this date on (e.g. 2025-01-31)')
+    subcommands.add_parser('show', help='List the questions in the table')
+    match_parser = subcommands.add_parser('match', help='Show which entry answers a question')
+    match_parser.add_argument('question', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        # Same prompts as the bots; the instructions only matter if system_instructions.txt is missing
+        from prompt_bundle import DEFAULT_INSTRUCTIONS, PromptBundle
+
+        bundle = None
+        while bundle is None:
+            bundle = PromptBundle.load(DEFAULT_INSTRUCTIONS)
+        count = asyncio.run(build(bundle, top=args.top, since=args.since))
+        print(f"📋 Wrote {count} FAQ entries to {get_faq_file()} (knowledge version {bundle.version})")
+    elif args.command == 'show':
+        table = FaqTable()
+        print(f"📋 FAQ table: {len(table.entries)} entries (knowledge version {table.version})")
+        for i, entry in enumerate(table.entries, 1):
+            print(f"  {i}. \"{entry['question']}\" ({entry['count']} times, {len(entry.get('variants', []))} variants)")
+    elif args.command == 'match':
+        question = ' '.join(args.question)
+        entry = FaqTable().match(question)
+        if entry:
+            print(f"✅ \"{entry['question']}\" (similarity {similarity(question_terms(question), entry['terms']):.2f})")
+        else:
+            print("❌ No FAQ entry matches")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Section-level retrieval over knowledge.txt
+Splits the knowledge base on its ##/### headings and builds a BM25 index so
+each question only sends the relevant sections to OpenAI, plus the pinned
+"TAOFU vs TPN" section that every answer needs.
+
+Run `python knowledge_index.py "your question"` to see which sections a
+question selects and how many prompt tokens that saves.
+"""
+
+import math
+import os
+import re
+import sys
+from collections import Counter
+
+HEADING_PATTERN = re.compile(r'^(#{2,3})\s+(.*)$')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for',
+    'from', 'how', 'i', 'in', 'is', 'it', 'its', 'me', 'my', 'of', 'on', 'or',
+    'the', 'this', 'to', 'was', 'what', 'when', 'where', 'which', 'who', 'why',
+    'with', 'you', 'your'
+}
+
+SUFFIXES = ('ing', 'ers', 'ed', 'er', 'es', 'ly', 's', 'e')
+
+# Stopwords in the body, but a heading like "WHAT IS TAOFU" says which question it answers
+QUESTION_WORDS = {'what', 'how', 'when', 'where', 'why', 'who', 'which'}
+
+# A question term in a section's own heading counts this many times a body match
+HEADING_BOOST = 2.0
+
+def stem(token):
+    """Strip common suffixes so "mine", "miners" and "mining" (or "whitelisted") match"""
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text):
+    """Lowercase, stemmed word tokens without stopwords"""
+    return [stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def heading_terms(text):
+    """Like tokenize, but keeping question words"""
+    return [stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS or t in QUESTION_WORDS]
+
+def estimate_tokens(text):
+    """Rough OpenAI token count (about 4 characters per token)"""
+    return len(text) // 4
+
+class Section:
+    """One ## or ### section of the knowledge base"""
+
+    def __init__(self, title, group, text):
+        self.title = title
+        self.group = group
+        self.text = text
+        self.tokens = estimate_tokens(text)
+
+class KnowledgeIndex:
+    """BM25 index over knowledge base sections"""
+
+    def __init__(self, text, pinned=None, k1=1.5, b=0.75):
+        self.full_tokens = estimate_tokens(text)
+        self.k1 = k1
+        self.b = b
+        pinned = pinned if pinned is not None else os.getenv('KB_PINNED_SECTION', 'TAOFU vs TPN')
+        self.sections = self._split(text)
+        self.pinned = [i for i, s in enumerate(self.sections) if pinned and pinned.lower() in s.group.lower()]
+
+        # Precompute the inverted index: term -> [(section index, term frequency)]
+        self.postings = {}
+        self.lengths = []
+        for i, section in enumerate(self.sections):
+            terms = tokenize(f"{section.group} {section.title} {section.text}")
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, []).append((i, tf))
+
+        # Terms of each section's own heading, scored separately so "what is taofu" finds "WHAT IS TAOFU"
+        self.heading_postings = {}
+        for i, section in enumerate(self.sections):
+            for term in set(heading_terms(section.title)):
+                self.heading_postings.setdefault(term, []).append(i)
+
+        count = len(self.sections)
+        self.avg_length = sum(self.lengths) / count if count else 0
+        self.idf = self._idf(self.postings, count)
+        self.heading_idf = self._idf(self.heading_postings, count)
+
+    @staticmethod
+    def _idf(postings, count):
+        return {
+            term: math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+
+    @staticmethod
+    def _split(text):
+        sections = []
+        group = ''
+        title = ''
+        lines = []
+
+        def flush():
+            body = '\n'.join(lines).strip()
+            if body:
+                sections.append(Section(title, group, body))
+
+        for line in text.splitlines():
+            match = HEADING_PATTERN.match(line)
+            if match:
+                flush()
+                lines = [line]
+                title = match.group(2).strip()
+                if match.group(1) == '##':
+                    group = title
+            else:
+                lines.append(line)
+        flush()
+        return sections
+
+    def search(self, question, k=4):
+        """Return (section index, score) for the k best matching sections"""
+        scores = Counter()
+        for term in set(tokenize(question)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        heading_scores = Counter()
+        topical = set()
+        for term in set(heading_terms(question)):
+            for i in self.heading_postings.get(term, ()):
+                heading_scores[i] += HEADING_BOOST * self.heading_idf[term]
+                if term not in QUESTION_WORDS:
+                    topical.add(i)
+        # A question word alone ("what ...") says nothing about the topic
+        for i in topical:
+            scores[i] += heading_scores[i]
+        return scores.most_common(k)
+
+    def build_context(self, question, top_k=None, max_tokens=None):
+        """Select the knowledge base text to send for a question
+
+        Returns the text and a report of how many prompt tokens it saves
+        compared to sending the whole knowledge base.
+        """
+        top_k = top_k if top_k is not None else int(os.getenv('KB_TOP_K', 4))
+        max_tokens = max_tokens if max_tokens is not None else int(os.getenv('KB_MAX_PROMPT_TOKENS', 1500))
+
+        selected = list(self.pinned)
+        budget = max_tokens - sum(self.sections[i].tokens for i in selected)
+        candidates = [i for i, _ in self.search(question, top_k + len(selected))]
+        if not candidates:
+            # Nothing matched, fall back to the overview sections at the top
+            candidates = [i for i in range(len(self.sections))]
+
+        added = 0
+        for i in candidates:
+            if added >= top_k:
+                break
+            if i in selected or self.sections[i].tokens > budget:
+                continue
+            selected.append(i)
+            budget -= self.sections[i].tokens
+            added += 1
+
+        # Keep document order so related sections read naturally
+        text = '\n\n'.join(self.sections[i].text for i in sorted(selected))
+        tokens = estimate_tokens(text)
+        report = {
+            'sections': len(selected),
+            'titles': [self.sections[i].title for i in sorted(selected)],
+            'tokens': tokens,
+            'full_tokens': self.full_tokens,
+            'tokens_saved': self.full_tokens - tokens
+        }
+        return text, report
+
+def main():
+    """Show the sections selected for a question"""
+    if len(sys.argv) < 2:
+        print('Usage: python knowledge_index.py "your question"')
+        return
+
+    with open('knowledge.txt', 'r', encoding='utf-8') as f:
+        index = KnowledgeIndex(f.read())
+
+    _, report = index.build_context(sys.argv[1])
+    print(f"📚 {len(index.sections)} sections indexed ({index.full_tokens} tokens)")
+    print(f"🔍 Selected {report['sections']} sections ({report['tokens']} tokens):")
+    for title in report['titles']:
+        print(f"  - {title}")
+    print(f"💰 Saved ~{report['tokens_saved']} prompt tokens per request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+Async OpenAI client for the Taofu bots
+Runs chat completions without blocking the event loop and caps how many
+requests the process has in flight at once, whichever event loop they come
+from. Each attempt has a timeout, retryable errors
+are retried with jittered exponential backoff, and a circuit breaker shared
+by both bots fails calls immediately while OpenAI keeps failing. Slow calls
+can optionally be hedged with a second identical request.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+import startup_profile
+
+logger = logging.getLogger('taofu.llm')
+
+# The openai package takes ~0.2s to import; see get_openai()
+_openai = None
+
+# Process-wide limit on concurrent upstream requests; see _get_semaphore()
+_limit = None
+_limit_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """Raised without calling OpenAI while the circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling OpenAI after repeated failures, then probes for recovery
+
+    After `failure_threshold` consecutive retryable failures the circuit
+    opens and calls fail at once. After `reset_timeout` seconds one trial
+    call is let through (half open); it closes the circuit if it succeeds
+    and reopens it if it fails. A trial that is cancelled before either
+    lets the next call try instead. Thread-safe, so the Twitter bot's loop and
+    the Discord bot's loop share one breaker when run together.
+    """
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv('OPENAI_CIRCUIT_FAILURES', 5))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else float(os.getenv('OPENAI_CIRCUIT_RESET', 30))
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        """Whether a call may go ahead now: False, True, or 'trial' for the half-open trial call"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return 'trial'
+            return False
+
+    def abandon_trial(self):
+        """The trial call ended without an outcome (e.g. it was cancelled)"""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("OpenAI circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    metrics.LLM_CIRCUIT_OPENED.inc()
+                    logger.warning("OpenAI circuit breaker opened", extra={
+                        'failures': self.failures,
+                        'reset_timeout': self.reset_timeout
+                    })
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+BREAKER = CircuitBreaker()
+metrics.LLM_CIRCUIT_STATE.set_function(lambda: {'closed': 0, 'half_open': 1, 'open': 2}[BREAKER.state])
+
+def get_max_concurrency():
+    """Maximum number of completions allowed in flight at once"""
+    return max(1, int(os.getenv('OPENAI_MAX_CONCURRENCY', 8)))
+
+def get_timeout():
+    """Seconds one attempt may take; for streams, the longest wait for each piece"""
+    return float(os.getenv('OPENAI_TIMEOUT', 30))
+
+def get_max_retries():
+    """Retries after the first attempt for timeouts, rate limits and server errors"""
+    return max(0, int(os.getenv('OPENAI_MAX_RETRIES', 2)))
+
+def get_hedge_delay():
+    """Seconds to wait before sending a second identical request (0 disables)"""
+    return float(os.getenv('OPENAI_HEDGE_AFTER', 0))
+
+def backoff_delay(retry, base=None, cap=None):
+    """Full-jitter exponential backoff before retry number `retry` (from 0)"""
+    base = base if base is not None else float(os.getenv('OPENAI_RETRY_BASE', 0.5))
+    cap = cap if cap is not None else float(os.getenv('OPENAI_RETRY_MAX', 8))
+    return random.uniform(0, min(cap, base * 2 ** retry))
+
+class SharedLimit:
+    """Async semaphore shared by every event loop in the process
+
+    start.py runs Discord and Twitter on separate loops; an asyncio.Semaphore
+    per loop would let each have OPENAI_MAX_CONCURRENCY requests in flight.
+    Waiters are served in order, whichever loop they are on.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.in_use = 0
+        self._waiters = deque()  # (loop, future)
+        self._lock = threading.Lock()
+
+    def locked(self):
+        """True if acquire() would have to wait"""
+        with self._lock:
+            return self.in_use >= self.size or bool(self._waiters)
+
+    def try_acquire(self):
+        """Take a slot if one is free right now; True if taken"""
+        with self._lock:
+            if self.in_use < self.size and not self._waiters:
+                self.in_use += 1
+                return True
+            return False
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_use < self.size and not self._waiters:
+                self.in_use += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and not waiter[1].cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    # Hand the slot straight to the next waiter
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    pass  # Its loop has closed
+            self.in_use -= 1
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+def _get_semaphore():
+    global _limit
+    with _limit_lock:
+        if _limit is None:
+            _limit = SharedLimit(get_max_concurrency())
+        return _limit
+
+def get_openai():
+    """The openai module, imported and configured on first use
+
+    Call warm_up() from a thread at startup to get this off the first
+    question's critical path.
+    """
+    global _openai
+    if _openai is None:
+        with startup_profile.phase('import openai'):
+            import openai
+        openai.api_key = os.getenv('OPENAI_API_KEY')
+        _openai = openai
+    return _openai
+
+def warm_up():
+    """Import the OpenAI client ahead of the first question"""
+    get_openai()
+
+def _api_kwargs():
+    kwargs = {}
+    api_base = os.getenv('OPENAI_API_BASE')
+    if api_base:
+        kwargs['api_base'] = api_base
+    return kwargs
+
+def is_retryable(error):
+    """Whether an error is worth retrying (and counts against the circuit breaker)"""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    errors = get_openai().error
+    if isinstance(error, (errors.RateLimitError, errors.APIConnectionError, errors.ServiceUnavailableError,
+                          errors.Timeout, errors.TryAgain)):
+        return True
+    if isinstance(error, errors.APIError):
+        return error.http_status is None or error.http_status >= 500
+    return False
+
+def _error_kind(error):
+    return 'timeout' if isinstance(error, asyncio.TimeoutError) else type(error).__name__
+
+async def _hedged(attempt, discard=None):
+    """Await `attempt()`, racing a second copy if the first is slow
+
+    The first result wins and the other attempt is cancelled; `discard` is
+    called with a result that is no longer needed (e.g. to close a stream).
+    The hedge takes a concurrency slot of its own for as long as it runs,
+    and is only sent if one is free.
+    """
+    delay = get_hedge_delay()
+    if not delay:
+        return await attempt()
+
+    semaphore = _get_semaphore()
+    first = asyncio.ensure_future(attempt())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and semaphore.try_acquire():
+            metrics.LLM_HEDGES.labels('sent').inc()
+            hedge = asyncio.ensure_future(attempt())
+            # A callback rather than `finally`, so a hedge cancelled before it starts still frees its slot
+            hedge.add_done_callback(lambda _: semaphore.release())
+            tasks.append(hedge)
+
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.LLM_HEDGES.labels('won').inc()
+                    tasks.remove(task)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+            task.add_done_callback(functools.partial(_release, discard))
+
+def _release(discard, task):
+    """Clean up after an attempt whose result is not used"""
+    if task.cancelled():
+        return
+    # Retrieving the exception also stops asyncio warning that it was never retrieved
+    if task.exception() is None and discard:
+        discard(task.result())
+
+async def _resilient(attempt, discard=None):
+    """Run `attempt` through the circuit breaker with retries and hedging"""
+    retries = get_max_retries()
+    for retry in range(retries + 1):
+        allowed = BREAKER.allow()
+        if not allowed:
+            metrics.LLM_CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+        try:
+            result = await _hedged(attempt, discard)
+        except asyncio.CancelledError:
+            # Neither a success nor a failure; don't hold up the next trial
+            if allowed == 'trial':
+                BREAKER.abandon_trial()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                BREAKER.record_failure()
+            else:
+                # OpenAI answered, even if it rejected this request
+                BREAKER.record_success()
+            if not retryable or retry == retries:
+                raise
+            metrics.LLM_RETRIES.labels(_error_kind(e)).inc()
+            await asyncio.sleep(backoff_delay(retry))
+        else:
+            BREAKER.record_success()
+            return result
+
+def _record_usage(usage, model, started, prompt_tokens=None, completion_tokens=None, estimated=False):
+    """Fill the caller's `usage` dict for the analytics record"""
+    if usage is None:
+        return
+    usage['model'] = model
+    usage['llm_latency'] = round(time.perf_counter() - started, 3)
+    if prompt_tokens is not None:
+        usage['prompt_tokens'] = prompt_tokens
+        usage['completion_tokens'] = completion_tokens
+        if estimated:
+            usage['tokens_estimated'] = True
+
+def _outcome(error):
+    if isinstance(error, CircuitOpenError):
+        return 'rejected'
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    return 'error'
+
+async def chat_completion(messages, model="gpt-4", max_tokens=1000, temperature=0.7, usage=None):
+    """Get a chat completion from OpenAI without blocking the event loop
+
+    Set OPENAI_API_BASE to point at a local stand-in server
+    (e.g. fake_openai_server.py) instead of api.openai.com.
+    Errors are raised to the caller, which decides on a fallback message;
+    CircuitOpenError means OpenAI was not called at all.
+    If given, `usage` is filled with the model, upstream latency and token
+    counts, even when the request fails.
+    """
+    def attempt():
+        return asyncio.wait_for(get_openai().ChatCompletion.acreate(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **_api_kwargs()
+        ), get_timeout())
+
+    async with _get_semaphore():
+        metrics.LLM_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await _resilient(attempt)
+            outcome = 'ok'
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            metrics.LLM_IN_FLIGHT.dec()
+            metrics.LLM_LATENCY.labels(model, outcome).observe(time.perf_counter() - started)
+            _record_usage(usage, model, started)
+
+    tokens = response.get('usage')
+    if tokens:
+        metrics.LLM_TOKENS.labels(model, 'prompt').inc(tokens['prompt_tokens'])
+        metrics.LLM_TOKENS.labels(model, 'completion').inc(tokens['completion_tokens'])
+        _record_usage(usage, model, started, tokens['prompt_tokens'], tokens['completion_tokens'])
+    return response.choices[0].message.content.strip()
+
+async def _open_stream(messages, model, max_tokens, temperature):
+    """Start a streamed completion and wait for its first text
+
+    Returns (first text, stream of the remaining chunks).
+    """
+    timeout = get_timeout()
+    response = await asyncio.wait_for(get_openai().ChatCompletion.acreate(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        **_api_kwargs()
+    ), timeout)
+    stream = response.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+        except StopAsyncIteration:
+            return '', stream
+        text = chunk.choices[0].delta.get('content')
+        if text:
+            return text, stream
+
+def _close_stream(opened):
+    _, stream = opened
+    if hasattr(stream, 'aclose'):
+        asyncio.ensure_future(stream.aclose())
+
+async def stream_chat_completion(messages, model="gpt-4", max_tokens=1000, temperature=0.7, usage=None):
+    """Yield the completion text piece by piece as OpenAI generates it
+
+    Counts against the same concurrency limit as chat_completion for the
+    whole length of the stream. Retries and hedging apply until the first
+    text arrives; after that a failure is raised to the caller, since text
+    has already been shown. `usage` is filled as for chat_completion, with
+    estimated token counts once the stream has finished.
+    """
+    async with _get_semaphore():
+        metrics.LLM_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        outcome = 'error'
+        chunks = 0
+        try:
+            text, stream = await _resilient(lambda: _open_stream(messages, model, max_tokens, temperature), _close_stream)
+            timeout = get_timeout()
+            while text:
+                chunks += 1
+                yield text
+                text = None
+                while not text:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    text = chunk.choices[0].delta.get('content')
+            outcome = 'ok'
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            metrics.LLM_IN_FLIGHT.dec()
+            metrics.LLM_LATENCY.labels(model, outcome).observe(time.perf_counter() - started)
+            _record_usage(usage, model, started)
+
+    # Streams carry no usage; estimate the prompt at ~4 characters a token, one token per chunk
+    prompt_tokens = sum(len(m['content']) for m in messages) // 4
+    metrics.LLM_TOKENS.labels(model, 'prompt').inc(prompt_tokens)
+    metrics.LLM_TOKENS.labels(model, 'completion').inc(chunks)
+    _record_usage(usage, model, started, prompt_tokens, chunks, estimated=True)
@@ -0,0 +1,272 @@
+"""
+Prometheus metrics for the Taofu bots
+A small in-process registry of counters, gauges and histograms, rendered in
+the Prometheus text format by the /metrics route in app.py. Updating a
+metric is a dict lookup and an addition under an uncontended lock, so it is
+cheap enough for the hot path; values that are costly to compute (memory,
+queue depths) are gauges read through a callback only when scraped.
+"""
+
+import bisect
+import os
+import resource
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.metrics):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """The child metric for one combination of label values
+
+        Look children up once and keep them when they are used on the hot path.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, self.labelnames, values)
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set_function(self, function):
+        """Read the total from `function()` at scrape time instead (e.g. CPU time)"""
+        self.function = function
+
+    def samples(self, name, labelnames, values):
+        value = self.function() if self.function else self.value
+        yield f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Read the value from `function()` at scrape time instead"""
+        self.function = function
+
+    def samples(self, name, labelnames, values):
+        value = self.function() if self.function else self.value
+        if value is not None:
+            yield f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self)
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels(labelnames, values, [('le', _format_value(bound))])} {cumulative}"
+        yield f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}"
+        yield f"{name}_count{_format_labels(labelnames, values)} {cumulative}"
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+def resident_memory_bytes():
+    """Current resident set size (Linux), falling back to the peak"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Process
+PROCESS_MEMORY = Gauge('process_resident_memory_bytes', 'Resident memory size in bytes')
+PROCESS_MEMORY.set_function(resident_memory_bytes)
+PROCESS_CPU = Counter('process_cpu_seconds_total', 'User and system CPU time in seconds')
+PROCESS_CPU.set_function(lambda: sum(os.times()[:2]))
+
+# OpenAI
+LLM_LATENCY = Histogram('taofu_llm_request_seconds', 'OpenAI chat completion latency', ['model', 'outcome'], buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter('taofu_llm_tokens_total', 'Tokens used by OpenAI chat completions', ['model', 'type'])
+LLM_IN_FLIGHT = Gauge('taofu_llm_in_flight', 'OpenAI requests currently in flight')
+LLM_RETRIES = Counter('taofu_llm_retries_total', 'OpenAI attempts retried, by error', ['error'])
+LLM_HEDGES = Counter('taofu_llm_hedges_total', 'Hedged OpenAI requests sent, and how many beat the original', ['result'])
+LLM_CIRCUIT_STATE = Gauge('taofu_llm_circuit_state', 'OpenAI circuit breaker state (0 closed, 1 half open, 2 open)')
+LLM_CIRCUIT_OPENED = Counter('taofu_llm_circuit_opened_total', 'Times the OpenAI circuit breaker opened')
+LLM_CIRCUIT_REJECTIONS = Counter('taofu_llm_circuit_rejections_total', 'OpenAI calls failed immediately by the open circuit breaker')
+
+# Answer cache
+ANSWER_CACHE_LOOKUPS = Counter('taofu_answer_cache_lookups_total', 'Answer cache lookups', ['result'])
+
+# Discord
+DISCORD_SEND_LATENCY = Histogram('taofu_discord_send_seconds', 'Time to send or edit a Discord message', ['kind'])
+
+# Analytics
+LOG_QUESTION_LATENCY = Histogram('taofu_log_question_seconds', 'Time spent in log_question on the caller side',
+                                 buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+ANALYTICS_WRITE_LATENCY = Histogram('taofu_analytics_write_seconds', 'Time to append a batch of analytics records to disk',
+                                    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+# Twitter
+TWITTER_POLL_LATENCY = Histogram('taofu_twitter_poll_seconds', 'Time to fetch new mentions', buckets=(0.25, 0.5, 1, 2, 5, 10, 30, 60))
+TWITTER_BACKLOG = Gauge('taofu_twitter_backlog', 'Mentions waiting in the reply pipeline', ['stage'])
+TWITTER_REPLIES = Counter('taofu_twitter_replies_total', 'Replies posted to Twitter')
+TWITTER_PREFILTER = Counter('taofu_twitter_prefilter_total', 'Mentions skipped or answered with an earlier reply before any OpenAI call', ['verdict'])
+
+# Model routing
+ROUTE_DECISIONS = Counter('taofu_route_decisions_total', 'Questions routed to each model', ['route', 'reason'])
+ROUTE_LATENCY = Histogram('taofu_route_request_seconds', 'OpenAI latency by route', ['route'], buckets=LLM_BUCKETS)
+ROUTE_OUTCOMES = Counter('taofu_route_outcomes_total', 'Routed answers that succeeded, failed or deflected to taofu.xyz', ['route', 'outcome'])
+
+# FAQ table
+FAQ_LOOKUPS = Counter('taofu_faq_lookups_total', 'Questions answered (hit) or not (miss) from the precomputed FAQ table', ['result'])
+
+# Conversation memory
+CONVERSATIONS_ACTIVE = Gauge('taofu_conversations_active', 'Channels with conversation memory held')
+CONVERSATION_SUMMARIES = Counter('taofu_conversation_summaries_total', 'Rolling conversation summaries written or failed', ['result'])
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Model routing for the Taofu bots
+Sends short FAQ-style questions that clearly match one part of the knowledge
+base to a cheaper, faster model, and everything complex or ambiguous to
+GPT-4. The decision uses only the question text and the knowledge base
+index already built for retrieval, so it costs no extra OpenAI call.
+
+Run `python model_router.py "your question"` to see how a question is routed.
+"""
+
+import os
+import re
+import sys
+import time
+
+import metrics
+
+# Questions asking for reasoning rather than a fact from the knowledge base
+COMPLEX_PATTERN = re.compile(
+    r"\b(why|compare|comparison|difference|differ|versus|vs|explain|pros|cons|"
+    r"should i|recommend|better|worse|risk|risks|strategy|calculate|predict|what if)\b",
+    re.IGNORECASE
+)
+
+# Answers where the model could not find the information
+DEFLECTION_PATTERN = re.compile(
+    r"\b(i'?m not sure|i don'?t (have|know)|not (covered|mentioned|available) in|unable to (find|provide))\b",
+    re.IGNORECASE
+)
+
+class Route:
+    """Which model answers a question, and why"""
+
+    def __init__(self, name, model, reason):
+        self.name = name
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.name!r}, {self.model!r}, {self.reason!r})"
+
+class ModelRouter:
+    """Chooses between a fast model and a strong one per question
+
+    MODEL_ROUTING is `auto` (classify each question), `fast` or `strong`
+    (always use that model). A question goes to the fast model only if it
+    is short, asks for no reasoning, and its best knowledge base section
+    topic scores at least ROUTE_MIN_SCORE and ROUTE_MIN_MARGIN ahead of the
+    next topic.
+    """
+
+    def __init__(self, policy=None, fast_model=None, strong_model=None,
+                 max_words=None, min_score=None, min_margin=None):
+        self.policy = (policy or os.getenv('MODEL_ROUTING', 'auto')).lower()
+        self.fast_model = fast_model or os.getenv('FAST_MODEL', 'gpt-4o-mini')
+        self.strong_model = strong_model or os.getenv('STRONG_MODEL', 'gpt-4')
+        self.max_words = max_words if max_words is not None else int(os.getenv('ROUTE_MAX_WORDS', 12))
+        self.min_score = min_score if min_score is not None else float(os.getenv('ROUTE_MIN_SCORE', 1.5))
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv('ROUTE_MIN_MARGIN', 0.25))
+
+    def classify(self, question, index):
+        """Return (route name, reason) for a question under the auto policy"""
+        if len(question.split()) > self.max_words:
+            return 'strong', 'long'
+        if question.count('?') > 1:
+            return 'strong', 'multiple'
+        if COMPLEX_PATTERN.search(question):
+            return 'strong', 'complex'
+
+        # Best score per topic: subsections of one topic matching together is not ambiguity
+        topics = {}
+        for i, score in index.search(question, k=8):
+            group = index.sections[i].group
+            topics[group] = max(topics.get(group, 0), score)
+        scores = sorted(topics.values(), reverse=True)
+        if not scores or scores[0] < self.min_score:
+            return 'strong', 'no_match'
+        if len(scores) > 1 and (scores[0] - scores[1]) / scores[0] < self.min_margin:
+            return 'strong', 'ambiguous'
+        return 'fast', 'faq'
+
+    def route(self, question, index):
+        """Pick the model for a question, given the knowledge base index"""
+        if self.policy in ('fast', 'strong'):
+            name, reason = self.policy, 'policy'
+        else:
+            name, reason = self.classify(question, index)
+        metrics.ROUTE_DECISIONS.labels(name, reason).inc()
+        return Route(name, self.fast_model if name == 'fast' else self.strong_model, reason)
+
+    def observe(self, route, started, answer=None):
+        """Count how a routed request went; `answer` is None if it failed"""
+        metrics.ROUTE_LATENCY.labels(route.name).observe(time.perf_counter() - started)
+        if answer is None:
+            outcome = 'error'
+        elif DEFLECTION_PATTERN.search(answer):
+            # The model could not answer from the knowledge base; too many on the fast route means it is too eager
+            outcome = 'deflected'
+        else:
+            outcome = 'ok'
+        metrics.ROUTE_OUTCOMES.labels(route.name, outcome).inc()
+
+def main():
+    """Show how a question is routed"""
+    if len(sys.argv) < 2:
+        print('Usage: python model_router.py "your question"')
+        return
+
+    from knowledge_index import KnowledgeIndex
+    from prompt_bundle import KNOWLEDGE_FILE
+
+    with open(KNOWLEDGE_FILE, 'r', encoding='utf-8') as f:
+        index = KnowledgeIndex(f.read())
+    question = ' '.join(sys.argv[1:])
+    router = ModelRouter()
+    route = router.route(question, index)
+    print(f"🧭 {route.name} ({route.reason}): {route.model}")
+    for i, score in index.search(question, k=4):
+        print(f"  - {index.sections[i].group} / {index.sections[i].title}: {score:.2f}")
+
+if __name__ == "__main__":
+    main()
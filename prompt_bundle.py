@@ -0,0 +1,158 @@
+"""
+Hot-reloadable prompts for the Taofu bots
+A PromptBundle holds everything built from knowledge.txt and
+system_instructions.txt: the instructions, the full system prompt, the
+section index and a version hash. PromptWatcher polls the files' mtimes and,
+when they change, builds a new bundle off the event loop and swaps it in with
+a single assignment. Requests keep the bundle they started with, so a reload
+never mixes two versions of the knowledge base in one answer.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from answer_cache import content_version
+from knowledge_index import KnowledgeIndex
+
+KNOWLEDGE_FILE = 'knowledge.txt'
+INSTRUCTIONS_FILE = 'system_instructions.txt'
+
+logger = logging.getLogger('taofu.prompts')
+
+DEFAULT_KNOWLEDGE = "Taofu is a decentralized ecosystem. Visit taofu.xyz for more information."
+
+# Fallback system instructions when system_instructions.txt is missing
+DEFAULT_INSTRUCTIONS = """You are the official Taofu ecosystem assistant. You help people learn about the Taofu ecosystem and provide accurate information based on the official documentation.
+
+IMPORTANT RULES:
+1. Only answer questions based on the provided Taofu knowledge base
+2. Never make up numbers, technical details, or tokenomics information
+3. If you're unsure about something, admit it and direct users to taofu.xyz
+4. Be concise and helpful
+5. Always mention you're the official Taofu assistant
+6. Encourage users to visit taofu.xyz for more information"""
+
+def file_signature(paths):
+    """(mtime, size) of each file, or None for a missing file"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+class PromptBundle:
+    """Instructions, knowledge base, system prompt and section index of one version
+
+    Built once and never modified, so it can be shared between requests
+    without locking.
+    """
+
+    def __init__(self, instructions, knowledge, version, signature=None):
+        self.instructions = instructions
+        self.knowledge = knowledge
+        self.version = version
+        self.signature = signature
+        self.system_prompt = self.make_system_prompt(knowledge)
+        self.index = KnowledgeIndex(knowledge)
+
+    @classmethod
+    def load(cls, default_instructions, knowledge_path=KNOWLEDGE_FILE, instructions_path=INSTRUCTIONS_FILE):
+        """Read the files and build a bundle, or None if they changed while being read"""
+        paths = (knowledge_path, instructions_path)
+        signature = file_signature(paths)
+        knowledge_data, instructions_data = read_bytes(knowledge_path), read_bytes(instructions_path)
+        if file_signature(paths) != signature:
+            return None
+
+        knowledge = knowledge_data.decode('utf-8') if knowledge_data is not None else DEFAULT_KNOWLEDGE
+        instructions = instructions_data.decode('utf-8') if instructions_data is not None else default_instructions
+        version = content_version([knowledge_data, instructions_data])
+        return cls(instructions, knowledge, version, signature)
+
+    def make_system_prompt(self, knowledge):
+        """Combine the system instructions with knowledge base text"""
+        return f"""{self.instructions}
+
+TAOFU KNOWLEDGE BASE:
+{knowledge}
+
+Remember: If asked about specific technical details, tokenomics, or information not covered in the knowledge base, direct users to taofu.xyz for the most current and accurate information."""
+
+    def system_prompt_for(self, question):
+        """Build the system prompt for a question"""
+        if os.getenv('KB_RETRIEVAL', '1') == '0':
+            return self.system_prompt
+
+        knowledge, report = self.index.build_context(question)
+        logger.debug("Prompt knowledge selected", extra={
+            'sections': report['sections'],
+            'tokens': report['tokens'],
+            'tokens_saved': report['tokens_saved']
+        })
+        return self.make_system_prompt(knowledge)
+
+class PromptWatcher:
+    """Keeps `bundle` up to date with the files on disk"""
+
+    def __init__(self, default_instructions, interval=None, on_reload=None,
+                 knowledge_path=KNOWLEDGE_FILE, instructions_path=INSTRUCTIONS_FILE):
+        self.default_instructions = default_instructions
+        self.interval = interval if interval is not None else float(os.getenv('PROMPT_RELOAD_INTERVAL', 5))
+        self.on_reload = on_reload
+        self.paths = (knowledge_path, instructions_path)
+        self.reloads = 0
+        self.bundle = None
+        while self.bundle is None:
+            self.bundle = PromptBundle.load(default_instructions, *self.paths)
+
+    def check(self):
+        """Reload if either file changed; returns True if a new bundle was swapped in"""
+        if file_signature(self.paths) == self.bundle.signature:
+            return False
+
+        started = time.perf_counter()
+        bundle = PromptBundle.load(self.default_instructions, *self.paths)
+        if bundle is None:
+            # Still being written; try again on the next check
+            return False
+
+        old_version = self.bundle.version
+        if bundle.version != old_version and self.on_reload:
+            self.on_reload(bundle)
+        self.bundle = bundle
+        if bundle.version == old_version:
+            # Touched but not changed
+            return False
+
+        self.reloads += 1
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.info("Reloaded prompts", extra={
+            'elapsed_ms': round(elapsed, 1),
+            'old_version': old_version,
+            'version': bundle.version,
+            'sections': len(bundle.index.sections)
+        })
+        return True
+
+    async def run(self):
+        """Check for changes every `interval` seconds until cancelled (0 disables)"""
+        if not self.interval:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception:
+                logger.exception("Error reloading prompts")
@@ -0,0 +1,98 @@
+"""
+Request limiting for the Taofu bots
+Token buckets stop one user (or one busy server) from flooding the bot, and
+the coalescer makes identical questions asked at the same time share a
+single OpenAI call. Both protect the OpenAI quota during announcement spikes.
+"""
+
+import asyncio
+import time
+
+class TokenBucket:
+    """Allows `capacity` requests at once, refilled at `rate` tokens per second"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now=None):
+        now = now if now is not None else time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        return self.tokens >= self.capacity
+
+class KeyedRateLimiter:
+    """One token bucket per key (user ID, guild ID, ...)"""
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.capacity = limit
+        self.rate = limit / window
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def get(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.prune()
+            bucket = self.buckets[key] = TokenBucket(self.capacity, self.rate)
+        return bucket
+
+    def prune(self):
+        """Forget buckets that have refilled completely; they behave like new ones"""
+        now = time.monotonic()
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.is_full():
+                del self.buckets[key]
+
+def acquire(*checks):
+    """Take one token from every (limiter, key) pair, or from none of them
+
+    Returns 0 if the request may go ahead, otherwise the seconds to wait.
+    A key of None skips that limiter (e.g. no guild for DMs).
+    """
+    now = time.monotonic()
+    buckets = []
+    for limiter, key in checks:
+        if key is None:
+            continue
+        bucket = limiter.get(key)
+        bucket.refill(now)
+        buckets.append(bucket)
+
+    retry_after = max((bucket.retry_after() for bucket in buckets), default=0.0)
+    if retry_after:
+        return retry_after
+    for bucket in buckets:
+        bucket.tokens -= 1
+    return 0.0
+
+class RequestCoalescer:
+    """Runs one call per key at a time and shares its result with every caller"""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.coalesced = 0
+
+    async def run(self, key, make_call):
+        """Await `make_call()` or join the identical call already running"""
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_call())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one waiter giving up does not cancel the call for the others
+        return await asyncio.shield(task)
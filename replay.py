@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Replay recorded traffic through the Taofu bots
+Reads the questions log_question wrote to the analytics log and replays them
+with their original timing, sped up 1x, 10x, 100x..., through `!ask` and the
+Twitter mention pipeline against fake_openai_server.py:
+
+    python replay.py --speeds 1,10,100
+    python replay.py --since 2025-01-31T18:00 --window 30 --latency 2
+
+By default the busiest `--window` minutes of the log are replayed. Each
+speed starts with an empty answer cache and reports throughput, latency,
+queueing delay (time not spent waiting for OpenAI) and how many questions
+were answered without calling OpenAI. The summary shows the highest speed
+before latency degrades, i.e. how many AMAs as busy as the recorded peak
+one instance can serve at once.
+
+Nothing is sent to OpenAI, Discord or Twitter. Scratch files go to a
+temporary directory; the analytics log is only read.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+import analytics_log
+from benchmark import FALLBACK_PREFIX, FakeContext, LoopMonitor, percentile
+from fake_openai_server import make_app
+
+PLATFORMS = ('Discord', 'Twitter')
+
+# Each speed's questions get their own block of user IDs, to find their analytics records
+RUN_ID_BLOCK = 10 ** 7
+
+def parse_time(timestamp):
+    return datetime.fromisoformat(timestamp)
+
+def busiest_start(path, window):
+    """Start of the busiest `window` of the log, found in one pass"""
+    recent = deque()
+    best_start, best_count = None, 0
+    for item in analytics_log.read_records(path):
+        if item.get('platform') not in PLATFORMS:
+            continue
+        at = parse_time(item['timestamp'])
+        recent.append(at)
+        while recent[0] <= at - window:
+            recent.popleft()
+        if len(recent) > best_count:
+            best_start, best_count = recent[0], len(recent)
+    return best_start
+
+def load_traffic(path, since=None, window_minutes=10, max_gap=30.0):
+    """(offset in seconds, platform, question) for each recorded question in the window
+
+    Gaps longer than `max_gap` seconds are shortened to it, so a quiet spell
+    does not stretch the replay.
+    """
+    window = timedelta(minutes=window_minutes)
+    start = parse_time(since) if since else busiest_start(path, window)
+    if start is None:
+        return []
+
+    traffic = []
+    offset = 0.0
+    previous = None
+    for item in analytics_log.read_records(path, since=start.isoformat()):
+        at = parse_time(item['timestamp'])
+        if at >= start + window:
+            break
+        if item.get('platform') not in PLATFORMS:
+            continue
+        if previous is not None:
+            offset += min((at - previous).total_seconds(), max_gap)
+        previous = at
+        traffic.append((offset, item['platform'], item['question']))
+    return traffic
+
+def peak_per_minute(traffic):
+    """Most questions in any 60 seconds of the recorded traffic"""
+    recent = deque()
+    peak = 0
+    for offset, _, _ in traffic:
+        recent.append(offset)
+        while recent[0] <= offset - 60:
+            recent.popleft()
+        peak = max(peak, len(recent))
+    return peak
+
+class FakePoster:
+    """Records replies instead of posting them to Twitter"""
+
+    def __init__(self, post_latency):
+        self.post_latency = post_latency
+        self.posted_at = {}
+        self.replies = {}
+
+    def post_reply(self, tweet_id, text):
+        time.sleep(self.post_latency)
+        self.posted_at[tweet_id] = time.perf_counter()
+        self.replies[tweet_id] = text
+
+class Replay:
+    """One replay of the traffic at one speed"""
+
+    def __init__(self, args, traffic, speed, run):
+        self.args = args
+        self.traffic = traffic
+        self.speed = speed
+        self.base_id = (run + 1) * RUN_ID_BLOCK
+        self.latencies = {}  # user ID -> seconds from arrival to answer
+        self.answers = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ask_discord(self, bot, user_id, question):
+        ctx = FakeContext(user_id=user_id, guild_id=None, send_latency=self.args.send_latency)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await bot.ask_question.callback(ctx, question=question)
+        finally:
+            self.in_flight -= 1
+        self.latencies[user_id] = time.perf_counter() - ctx.started_at
+        self.answers.append(ctx.answer)
+
+    async def run(self):
+        import bot
+        import twitter_bot
+        from reply_state import ReplyState
+        from twitter_api import Mention
+
+        poster = FakePoster(self.args.post_latency)
+        twitter_bot.twitter = poster
+        state = ReplyState()
+        pipeline = twitter_bot.MentionPipeline(state, 'taofu_bot')
+        pipeline.start()
+        submitted_at = {}
+
+        monitor = LoopMonitor()
+        monitor_task = asyncio.create_task(monitor.run())
+        tasks = []
+        started = time.perf_counter()
+        for i, (offset, platform, question) in enumerate(self.traffic):
+            delay = started + offset / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            user_id = self.base_id + i
+            if platform == 'Discord':
+                tasks.append(asyncio.create_task(self.ask_discord(bot, user_id, question)))
+            else:
+                state.mark_pending(user_id)
+                submitted_at[user_id] = time.perf_counter()
+                pipeline.submit(Mention(user_id, f"@taofu_bot {question}", user_id, f"user{i}"))
+
+        await asyncio.gather(*tasks)
+        await pipeline.answer_queue.join()
+        await pipeline.post_queue.join()
+        self.elapsed = time.perf_counter() - started
+        await pipeline.stop()
+        state.close()
+        monitor_task.cancel()
+        self.monitor = monitor
+
+        for tweet_id, posted_at in poster.posted_at.items():
+            self.latencies[tweet_id] = posted_at - submitted_at[tweet_id]
+        self.answers.extend(poster.replies.values())
+        analytics_log.get_writer().flush()
+        self.records = {
+            int(item['user_id']): item
+            for item in analytics_log.read_records()
+            if self.base_id <= int(item['user_id']) < self.base_id + RUN_ID_BLOCK
+        }
+
+    def report(self, llm_requests):
+        """Print this speed's results and return its summary"""
+        latencies = list(self.latencies.values())
+        # Time not spent waiting for OpenAI: concurrency limits, queues, cache and Discord/Twitter calls
+        queueing = [
+            max(0.0, latency - self.records.get(user_id, {}).get('llm_latency', 0.0))
+            for user_id, latency in self.latencies.items()
+        ]
+        outcomes = Counter(record.get('outcome', 'unknown') for record in self.records.values())
+        answered = sum(outcomes.values())
+        without_llm = sum(outcomes[o] for o in ('faq', 'cache', 'coalesced', 'degraded', 'duplicate'))
+        fallbacks = sum(1 for answer in self.answers if answer.startswith(FALLBACK_PREFIX))
+        duration = self.traffic[-1][0] / self.speed if self.traffic else 0.0
+        offered = len(self.traffic) / duration if duration else float('inf')
+        throughput = len(latencies) / self.elapsed if self.elapsed else 0.0
+
+        print(f"\n🔁 {self.speed:g}x: {len(self.traffic)} questions over {duration:.1f}s ({offered:.1f}/s offered)")
+        print(f"  Throughput: {throughput:.1f} answers/s, finished in {self.elapsed:.1f}s (max {self.max_in_flight} Discord questions in flight)")
+        print(f"  Latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.0f} ms")
+        print(f"  Queueing delay p50 {percentile(queueing, 50) * 1000:.0f} ms, p95 {percentile(queueing, 95) * 1000:.0f} ms")
+        print("  Outcomes: " + ', '.join(f"{outcome} {count}" for outcome, count in outcomes.most_common()))
+        print(f"  Answered without OpenAI: {without_llm / max(answered, 1):.0%} ({llm_requests} OpenAI requests)")
+        print(f"  Fallback answers: {fallbacks} ({fallbacks / max(len(self.answers), 1):.1%})")
+        print(f"  Event loop blocked: {self.monitor.blocked * 1000:.0f} ms (max {self.monitor.max_lag * 1000:.1f} ms)")
+        return {
+            'speed': self.speed,
+            'p95': percentile(latencies, 95),
+            'fallback_rate': fallbacks / max(len(self.answers), 1),
+            'offered': offered,
+            'throughput': throughput
+        }
+
+def degraded(result, baseline, factor):
+    """Whether a run is much slower, or less reliable, than the slowest-speed run"""
+    return (result['p95'] > factor * max(baseline['p95'], 0.001)
+            or result['fallback_rate'] > baseline['fallback_rate'] + 0.05)
+
+def summarize(results, traffic, factor):
+    """Print the capacity summary across speeds"""
+    peak = peak_per_minute(traffic)
+    baseline = results[0]
+    first = next((r for r in results if degraded(r, baseline, factor)), None)
+    held = max((r['speed'] for r in results if first is None or r['speed'] < first['speed']), default=None)
+    ceiling = max(r['throughput'] for r in results)
+
+    print(f"\n📈 Recorded peak: {peak} questions/min; throughput ceiling {ceiling:.1f} answers/s")
+    if first:
+        print(f"  Latency degrades at {first['speed']:g}x (p95 {first['p95'] * 1000:.0f} ms vs "
+              f"{baseline['p95'] * 1000:.0f} ms at {baseline['speed']:g}x)")
+    else:
+        print("  Latency held up at every speed tried; try higher --speeds")
+    if held:
+        print(f"  One instance serves about {held:g} AMAs as busy as the recorded peak at once")
+
+async def run(args, traffic):
+    """Start the fake OpenAI server and replay the traffic at each speed"""
+    app = make_app(args.latency, args.token_delay, args.error_rate)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    os.environ['OPENAI_API_BASE'] = f"http://127.0.0.1:{runner.addresses[0][1]}/v1"
+
+    import bot
+    results = []
+    try:
+        for run_index, speed in enumerate(args.speeds):
+            # Every speed starts cold, like a fresh deploy
+            bot.engine().cache.clear()
+            app['stats']['requests'] = 0
+            replay = Replay(args, traffic, speed, run_index)
+            await replay.run()
+            results.append(replay.report(app['stats']['requests']))
+    finally:
+        await runner.cleanup()
+    summarize(results, traffic, args.degrade_factor)
+
+def main():
+    """Replay recorded traffic"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--analytics', default=analytics_log.get_analytics_file(), help='Analytics log to replay')
+    parser.add_argument('--speeds', default='1,10,100', help='Comma-separated speed-ups to replay at')
+    parser.add_argument('--since', help='Replay from this time instead of the busiest window (e.g. 2025-01-31T18:00)')
+    parser.add_argument('--window', type=float, default=10, help='Minutes of recorded traffic to replay')
+    parser.add_argument('--max-gap', type=float, default=30, help='Longest recorded pause kept, in seconds')
+    parser.add_argument('--faq', help='FAQ table to answer from (default: none)')
+    parser.add_argument('--degrade-factor', type=float, default=2.0, help='p95 latency increase counted as degraded')
+    parser.add_argument('--latency', type=float, default=1.5, help='Fake OpenAI seconds before answering')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='Fake OpenAI seconds between streamed words')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake OpenAI requests that fail')
+    parser.add_argument('--send-latency', type=float, default=0.05, help='Fake Discord seconds per send/edit')
+    parser.add_argument('--post-latency', type=float, default=0.05, help='Fake Twitter seconds per reply')
+    args = parser.parse_args()
+    args.speeds = sorted(float(s) for s in args.speeds.split(','))
+
+    # Bring over an old analytics.json first, so the scratch log's writer cannot claim it
+    analytics_log.migrate_legacy(args.analytics)
+    if not os.path.exists(args.analytics):
+        print(f"No analytics log at {args.analytics}. Run the bots first to record traffic.")
+        return
+    traffic = load_traffic(args.analytics, args.since, args.window, args.max_gap)
+    if not traffic:
+        print("No Discord or Twitter questions in the selected window.")
+        return
+    print(f"📼 Replaying {len(traffic)} questions ({Counter(p for _, p, _ in traffic)['Twitter']} from Twitter) "
+          f"covering {traffic[-1][0] / 60:.1f} recorded minutes")
+
+    scratch = tempfile.mkdtemp(prefix='taofu-replay-')
+    faq_file = os.path.join(scratch, 'faq_table.json')
+    if args.faq:
+        shutil.copy(args.faq, faq_file)
+    os.environ.update({
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY') or 'replay',
+        'ANSWER_CACHE_FILE': os.path.join(scratch, 'answer_cache.db'),
+        'ANALYTICS_FILE': os.path.join(scratch, 'analytics.ndjson'),
+        'REPLY_STATE_FILE': os.path.join(scratch, 'reply_state.json'),
+        'FAQ_FILE': faq_file,
+        'FAQ_AUTO_REBUILD': '0',
+        'TWITTER_POST_LIMIT': str(len(traffic) * 10),
+        'PROMPT_RELOAD_INTERVAL': '0',
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FORMAT': os.getenv('LOG_FORMAT', 'text')
+    })
+
+    try:
+        asyncio.run(run(args, traffic))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
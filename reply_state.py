@@ -0,0 +1,146 @@
+"""
+Reply tracking for the Twitter bot
+Keeps a since_id high-water mark plus a bounded window of recently handled
+tweet IDs. Every change is appended to a small journal, and the journal is
+periodically compacted into a snapshot that is swapped in atomically, so
+memory and disk use stay constant over months of uptime.
+
+A tweet is marked `pending` before its reply is posted and `done` after, so
+after a crash the bot knows exactly which tweets it may have been in the
+middle of answering.
+"""
+
+import json
+import logging
+import os
+from collections import OrderedDict
+
+PENDING = 'pending'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+LEGACY_REPLIED_FILE = 'replied_tweets.json'
+
+logger = logging.getLogger('taofu.reply_state')
+
+class ReplyState:
+    """since_id high-water mark and bounded set of handled tweets"""
+
+    def __init__(self, path=None, window=None, legacy_path=LEGACY_REPLIED_FILE):
+        self.path = path or os.getenv('REPLY_STATE_FILE', 'reply_state.json')
+        self.journal_path = self.path + '.journal'
+        self.window = window or int(os.getenv('REPLY_STATE_WINDOW', 1000))
+        self.since_id = None
+        self.states = OrderedDict()  # tweet id -> state, oldest first
+        self._journal = None
+        self._journal_lines = 0
+
+        if os.path.exists(self.path):
+            self._load_snapshot()
+        elif os.path.exists(legacy_path):
+            self._migrate_legacy(legacy_path)
+        self._replay_journal()
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _load_snapshot(self):
+        with open(self.path, 'r') as f:
+            snapshot = json.load(f)
+        self.since_id = snapshot.get('since_id')
+        for tweet_id, state in snapshot.get('tweets', []):
+            self.states[tweet_id] = state
+
+    def _migrate_legacy(self, legacy_path):
+        try:
+            with open(legacy_path, 'r') as f:
+                replied = sorted(int(tweet_id) for tweet_id in json.load(f))
+        except (json.JSONDecodeError, ValueError):
+            replied = []
+        for tweet_id in replied[-self.window:]:
+            self.states[tweet_id] = DONE
+        self.since_id = replied[-1] if replied else None
+        self.compact()
+        os.replace(legacy_path, legacy_path + '.migrated')
+        logger.info("Migrated %d replied tweets from %s", len(replied), legacy_path)
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        torn = False
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from a crash; every earlier entry is intact
+                    torn = True
+                    break
+                self._apply(entry['id'], entry['state'])
+                self._journal_lines += 1
+                if not line.endswith('\n'):
+                    torn = True
+        if torn:
+            # Appending after the bad tail would hide every later entry from the next replay
+            logger.warning("Discarding torn journal entry", extra={'journal': self.journal_path})
+            self.compact()
+
+    def _apply(self, tweet_id, state):
+        self.states.pop(tweet_id, None)
+        self.states[tweet_id] = state
+        if self.since_id is None or tweet_id > self.since_id:
+            self.since_id = tweet_id
+        # Forget the oldest finished tweets; since_id keeps them from being fetched again
+        excess = len(self.states) - self.window
+        if excess > 0:
+            finished = [i for i, st in self.states.items() if st != PENDING][:excess]
+            for old_id in finished:
+                del self.states[old_id]
+
+    def _record(self, tweet_id, state):
+        self._apply(tweet_id, state)
+        self._journal.write(json.dumps({'id': tweet_id, 'state': state}) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_lines += 1
+        if self._journal_lines >= self.window:
+            self.compact()
+
+    def compact(self):
+        """Write a snapshot atomically and start a fresh journal"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'since_id': self.since_id, 'tweets': list(self.states.items())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._journal_lines = 0
+
+    def is_handled(self, tweet_id):
+        """True if the tweet has been seen before, whatever its state"""
+        return tweet_id in self.states or (self.since_id is not None and tweet_id <= self.since_id)
+
+    def pending(self):
+        """Tweets that were being answered but never finished"""
+        return [tweet_id for tweet_id, state in self.states.items() if state == PENDING]
+
+    def mark_pending(self, tweet_id):
+        self._record(tweet_id, PENDING)
+
+    def mark_done(self, tweet_id):
+        self._record(tweet_id, DONE)
+
+    def mark_skipped(self, tweet_id):
+        self._record(tweet_id, SKIPPED)
+
+    def mark_failed(self, tweet_id):
+        self._record(tweet_id, FAILED)
+
+    def close(self):
+        """Compact and close the journal"""
+        self.compact()
+        self._journal.close()
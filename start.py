@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Single-process entry point for the Taofu bots
+Runs the Discord bot, the Twitter mention loop and the health/metrics HTTP
+server in one interpreter, sharing one answer engine (knowledge base, prompt
+index, answer cache) and one analytics writer:
+
+    python start.py
+
+START_COMPONENTS picks what runs (default: every component whose
+credentials are set, plus the HTTP server). A component that crashes is
+restarted with backoff without touching the others. SIGTERM/SIGINT stop
+everything gracefully: the Twitter loop leaves unfinished tweets pending,
+Discord disconnects and queued analytics records are flushed.
+"""
+
+import abc
+import asyncio
+import os
+import signal
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import analytics_log
+import startup_profile
+import structured_log
+
+load_dotenv()
+
+logger = structured_log.get_logger('supervisor')
+
+class Component(abc.ABC):
+    """Part of the bot the supervisor starts, restarts after a crash and stops"""
+
+    name = 'component'
+
+    @abc.abstractmethod
+    async def run(self):
+        """Run until stopped (returns) or crashed (raises)"""
+
+    @abc.abstractmethod
+    async def stop(self):
+        """Ask `run` to return"""
+
+class DiscordComponent(Component):
+    """The Discord client on the supervisor's event loop"""
+
+    name = 'discord'
+
+    def __init__(self, token):
+        self.token = token
+        self.client = None
+
+    async def run(self):
+        with startup_profile.phase('import discord bot'):
+            import bot
+        self.client = bot.bot
+        if self.client.is_closed():
+            # Restarting after a crash
+            self.client.clear()
+        try:
+            await self.client.start(self.token)
+        finally:
+            # Release the HTTP session if login or the connection failed
+            if not self.client.is_closed():
+                await self.client.close()
+
+    async def stop(self):
+        if self.client and not self.client.is_closed():
+            await self.client.close()
+
+class TwitterComponent(Component):
+    """The mention loop, on its own thread and event loop
+
+    Its polling, fsyncs and SQLite calls can't stall Discord's heartbeat.
+    """
+
+    name = 'twitter'
+
+    def __init__(self):
+        self.thread = None
+        self.loop = None
+        self.task = None
+
+    async def run(self):
+        main_loop = asyncio.get_running_loop()
+        finished = main_loop.create_future()
+
+        def target():
+            try:
+                with startup_profile.phase('import twitter bot'):
+                    import twitter_bot
+                asyncio.run(self._monitor(twitter_bot))
+            except Exception as e:
+                main_loop.call_soon_threadsafe(finished.set_exception, e)
+            else:
+                main_loop.call_soon_threadsafe(finished.set_result, None)
+
+        self.thread = threading.Thread(target=target, name='twitter', daemon=True)
+        self.thread.start()
+        await finished
+
+    async def _monitor(self, twitter_bot):
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        try:
+            await twitter_bot.monitor_mentions()
+        except asyncio.CancelledError:
+            pass
+
+    async def stop(self):
+        if self.loop and self.task:
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self.thread:
+            await asyncio.to_thread(self.thread.join)
+
+class HttpComponent(Component):
+    """Health check and /metrics (app.py) on the Railway PORT
+
+    The platform health check expects PORT, so METRICS_PORT never replaces
+    it; if set to another port, the same endpoints are served there too.
+    """
+
+    name = 'http'
+
+    def __init__(self):
+        self.servers = []
+        self.stopped = None
+
+    async def run(self):
+        self.stopped = asyncio.Event()
+        self.servers = await asyncio.to_thread(self._start)
+        startup_profile.milestone('http serving')
+        await self.stopped.wait()
+
+    def _start(self):
+        # Flask takes a while to import; keep it off the event loop
+        with startup_profile.phase('import http server'):
+            import app
+        port = int(os.getenv('PORT', 8080))
+        servers = [app.start_background(port)]
+        metrics_port = int(os.getenv('METRICS_PORT') or port)
+        if metrics_port != port:
+            servers.append(app.start_background(metrics_port))
+        return servers
+
+    async def stop(self):
+        for server in self.servers:
+            await asyncio.to_thread(server.shutdown)
+            server.server_close()
+        self.servers = []
+        if self.stopped:
+            self.stopped.set()
+
+def build_components():
+    """Components named in START_COMPONENTS, or every one that is configured"""
+    names = os.getenv('START_COMPONENTS')
+    if names:
+        names = {name.strip().lower() for name in names.split(',') if name.strip()}
+    else:
+        names = {'http'}
+        if os.getenv('DISCORD_TOKEN'):
+            names.add('discord')
+        if os.getenv('TWITTER_API_KEY'):
+            names.add('twitter')
+
+    components = []
+    if 'http' in names:
+        components.append(HttpComponent())
+    if 'discord' in names:
+        components.append(DiscordComponent(os.getenv('DISCORD_TOKEN')))
+    if 'twitter' in names:
+        components.append(TwitterComponent())
+    return components
+
+async def supervise(component, stopping):
+    """Run a component, restarting it with backoff until shutdown"""
+    backoff = 1
+    max_backoff = float(os.getenv('RESTART_MAX_BACKOFF', 300))
+    while not stopping.is_set():
+        started = time.monotonic()
+        try:
+            logger.info("Starting %s", component.name)
+            await component.run()
+            if stopping.is_set():
+                break
+            logger.warning("%s exited unexpectedly", component.name)
+        except Exception:
+            if stopping.is_set():
+                break
+            logger.exception("%s crashed", component.name)
+
+        # A component that ran for a while gets a fresh backoff
+        if time.monotonic() - started > max_backoff:
+            backoff = 1
+        logger.info("Restarting %s in %ds", component.name, backoff)
+        try:
+            await asyncio.wait_for(stopping.wait(), backoff)
+        except asyncio.TimeoutError:
+            pass
+        backoff = min(backoff * 2, max_backoff)
+    logger.info("Stopped %s", component.name)
+
+async def run(components):
+    """Start every component and stop them all on SIGTERM/SIGINT"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    tasks = [asyncio.create_task(supervise(c, stopping), name=c.name) for c in components]
+    await stopping.wait()
+
+    logger.info("Shutting down")
+    timeout = float(os.getenv('SHUTDOWN_TIMEOUT', 20))
+    # Bots first so nothing new is queued, then the HTTP server
+    bots = [c for c in components if c.name != 'http']
+    others = [c for c in components if c.name == 'http']
+    for group in (bots, others):
+        results = await asyncio.gather(
+            *(asyncio.wait_for(c.stop(), timeout) for c in group),
+            return_exceptions=True
+        )
+        for component, result in zip(group, results):
+            if isinstance(result, BaseException):
+                logger.error("Error stopping %s: %r", component.name, result)
+
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.to_thread(analytics_log.get_writer().flush)
+
+def main():
+    components = build_components()
+    logger.info("Starting components: %s", ', '.join(c.name for c in components), extra={
+        'since_process_start': round(startup_profile.process_age(), 3)
+    })
+    asyncio.run(run(components))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Startup profiling for the Taofu bots
+Records how long each startup phase takes (imports, building the prompts,
+connecting) and when milestones such as the first answered question are
+reached, measured from when the OS started the process. Set
+STARTUP_PROFILE=1 to log them.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('taofu.startup')
+
+_imported_at = time.perf_counter()
+_lock = threading.Lock()
+_phases = []
+_milestones = set()
+
+def enabled():
+    return os.getenv('STARTUP_PROFILE', '0') == '1'
+
+def process_age():
+    """Seconds since the process started (Linux), else since this module was imported"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _imported_at
+
+class phase:
+    """Context manager timing one startup phase
+
+        with startup_profile.phase('build prompts'):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        with _lock:
+            _phases.append((self.name, round(elapsed * 1000, 1)))
+        if enabled():
+            logger.info("Startup phase %s", self.name, extra={'elapsed_ms': round(elapsed * 1000, 1)})
+        return False
+
+def milestone(name):
+    """Log the first time a milestone is reached, with every phase timed so far"""
+    with _lock:
+        if name in _milestones:
+            return
+        _milestones.add(name)
+        phases = dict(_phases)
+    if enabled():
+        logger.info("Startup milestone %s", name, extra={
+            'since_process_start': round(process_age(), 3),
+            'phases_ms': phases
+        })
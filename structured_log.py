@@ -0,0 +1,129 @@
+"""
+Structured logging for the Taofu bots
+Log calls only put the record on a queue; a background listener thread
+formats it (one JSON object per line by default) and writes it to stdout,
+so logging never blocks the event loop on a slow log pipeline.
+
+Extra fields go in `extra=` and show up as JSON keys:
+
+    logger = structured_log.get_logger('discord')
+    logger.info("Question answered", extra={'user_id': 123, 'latency_ms': 840})
+
+High-volume debug events can be sampled with `extra=sampled(...)`; only
+LOG_SAMPLE_RATE of them are kept.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_setup_lock = threading.Lock()
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the record's extra fields as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'sampled':
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and k != 'sampled'}
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+class SamplingFilter(logging.Filter):
+    """Keeps only `rate` of the records marked with sampled()"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False):
+            if random.random() >= self.rate:
+                return False
+            record.sample_rate = self.rate
+        return True
+
+class BackgroundQueueHandler(QueueHandler):
+    """Queues records with their message already rendered"""
+
+    def prepare(self, record):
+        # Render the message and traceback now, while the arguments are
+        # still valid, but leave the JSON formatting to the listener thread
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+def sampled(**fields):
+    """`extra=` for a high-volume event that is only logged LOG_SAMPLE_RATE of the time"""
+    return dict(fields, sampled=True)
+
+def setup_logging(level=None, fmt=None):
+    """Route all logging through a queue to a background writer (idempotent)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+        fmt = (fmt or os.getenv('LOG_FORMAT', 'json')).lower()
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        handler = BackgroundQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 0.01))))
+
+        root = logging.getLogger()
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+        # discord.py and tweepy are chatty at DEBUG; keep them at INFO unless asked
+        for name in ('discord', 'tweepy', 'urllib3', 'openai'):
+            logging.getLogger(name).setLevel(max(logging.INFO, root.level))
+
+        _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+def get_logger(name):
+    """Logger for one part of the bots, e.g. get_logger('twitter')"""
+    setup_logging()
+    return logging.getLogger(f'taofu.{name}')
@@ -5,8 +5,8 @@ Tests the core functionality without requiring all API keys
 """
 
 import os
-import json
-from datetime import datetime
+import shutil
+import tempfile
 
 def test_knowledge_base():
     """Test knowledge base loading"""
@@ -40,40 +40,144 @@ def test_system_instructions():
         print(f"❌ Error loading system instructions: {e}")
         return False
 
+def test_knowledge_retrieval():
+    """Test that common questions select the sections that answer them"""
+    print("\n🔎 Testing knowledge retrieval...")
+    try:
+        from knowledge_index import KnowledgeIndex
+
+        with open('knowledge.txt', 'r', encoding='utf-8') as f:
+            index = KnowledgeIndex(f.read())
+
+        expected = {
+            "What is Taofu?": "1. WHAT IS TAOFU",
+            "How do I get whitelisted?": "Whitelisting",
+            "What is TPN?": "9. TPN SUBNET (SUBNET 65) - EXAMPLE PROJECT",
+            "How can I mine on TPN?": "For Miners",
+            "When does vesting unlock?": "Vesting Schedules",
+            "What are the fees?": "Fee Structure",
+            "How do Subnet Seeds (SNS) work?": "Subnet Seeds (SNS)",
+            "What currency is used for purchases?": "Purchase Process"
+        }
+        missed = []
+        for question, title in expected.items():
+            _, report = index.build_context(question)
+            if title not in report['titles']:
+                missed.append(f"{question} -> {title}")
+        if missed:
+            for miss in missed:
+                print(f"❌ Not selected: {miss}")
+            return False
+
+        print(f"✅ {len(expected)} common questions select the right sections")
+        return True
+    except FileNotFoundError:
+        print("❌ knowledge.txt not found")
+        return False
+    except Exception as e:
+        print(f"❌ Error testing knowledge retrieval: {e}")
+        return False
+
 def test_analytics_logging():
     """Test analytics logging functionality"""
     print("\n📊 Testing analytics logging...")
     try:
-        # Test logging function
-        test_data = {
-            'timestamp': datetime.now().isoformat(),
-            'user_id': 'test_user_123',
-            'username': 'test_user',
-            'question': 'What is Taofu?',
-            'response_preview': 'Taofu is a decentralized ecosystem...',
-            'platform': 'Test'
-        }
-        
-        # Load existing analytics or create new
+        from analytics_log import AnalyticsWriter, make_record, read_records
+
+        # Write to a scratch directory so the real analytics files are never touched
+        scratch = tempfile.mkdtemp(prefix='taofu-test-')
+        test_file = os.path.join(scratch, 'analytics.ndjson')
         try:
-            with open('analytics.json', 'r') as f:
-                analytics = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            analytics = []
-        
-        # Add test data
-        analytics.append(test_data)
-        
-        # Save back
-        with open('analytics.json', 'w') as f:
-            json.dump(analytics, f, indent=2)
-        
+            writer = AnalyticsWriter(path=test_file)
+            writer.log(make_record('test_user_123', 'test_user', 'What is Taofu?', 'Taofu is a decentralized ecosystem...', 'Test'))
+            writer.flush()
+            writer.close()
+            records = list(read_records(test_file))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if len(records) != 1 or records[0]['question'] != 'What is Taofu?':
+            print("❌ Analytics record was not written correctly")
+            return False
+
         print("✅ Analytics logging works")
         return True
     except Exception as e:
         print(f"❌ Error testing analytics: {e}")
         return False
 
+def test_reply_state_torn_write():
+    """Test that reply state survives a crash in the middle of a journal write"""
+    print("\n📝 Testing reply state after a torn write...")
+    try:
+        from reply_state import ReplyState, DONE
+
+        scratch = tempfile.mkdtemp(prefix='taofu-test-')
+        path = os.path.join(scratch, 'reply_state.json')
+        legacy = os.path.join(scratch, 'replied_tweets.json')
+        try:
+            state = ReplyState(path=path, legacy_path=legacy)
+            state.mark_pending(1)
+            state.mark_done(1)
+            state.mark_pending(2)
+            state._journal.close()
+            # The crash cut the last entry short
+            with open(state.journal_path, 'a', encoding='utf-8') as f:
+                f.write('{"id": 3, "sta')
+
+            state = ReplyState(path=path, legacy_path=legacy)
+            state.mark_done(2)
+            state.mark_pending(4)
+            state.mark_done(4)
+            state._journal.close()
+
+            state = ReplyState(path=path, legacy_path=legacy)
+            states = dict(state.states)
+            state.close()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if states != {1: DONE, 2: DONE, 4: DONE} or state.since_id != 4:
+            print(f"❌ Entries after the torn write were lost: {states}, since_id {state.since_id}")
+            return False
+
+        print("✅ Entries written after a torn write survive the next restart")
+        return True
+    except Exception as e:
+        print(f"❌ Error testing reply state: {e}")
+        return False
+
+def test_tweet_filter():
+    """Test the Twitter pre-filter's duplicate handling"""
+    print("\n🐦 Testing tweet pre-filter...")
+    try:
+        import asyncio
+        from tweet_filter import TweetFilter
+
+        async def check():
+            prefilter = TweetFilter(window=3600, max_replies=3)
+            first = prefilter.check("what is the TAOFU token supply?", 1, tweet_id=100)
+            prefilter.answered(first, "TAOFU has a fixed supply.")
+            # Posting the reply failed, so retry_pending runs the same tweet through again
+            retry = prefilter.check("what is the TAOFU token supply?", 1, tweet_id=100)
+            copy = prefilter.check("What is the TAOFU token supply", 2, tweet_id=101)
+            reworded = prefilter.check("what is the TPN token supply?", 3, tweet_id=102)
+            # Same author: a reworded repeat (shingle Jaccard 0.90) and a new question (0.08)
+            prefilter.check("what is the TAOFU token supply right now?", 4, tweet_id=103)
+            flood = prefilter.check("what is the TAOFU token supply right now pls?", 4, tweet_id=104)
+            different = prefilter.check("how do I stake TAOFU on a validator?", 4, tweet_id=105)
+            return first.action, retry.action, copy.action, reworded.action, flood.action, different.action
+
+        actions = asyncio.run(check())
+        expected = ('answer', 'answer', 'reuse', 'answer', 'skip', 'answer')
+        if actions != expected:
+            print(f"❌ Expected {expected}, got {actions}")
+            return False
+
+        print("✅ Retries are answered, copies reuse the reply, only an author's own rewordings are skipped")
+        return True
+    except Exception as e:
+        print(f"❌ Error testing tweet pre-filter: {e}")
+        return False
+
 def test_environment_setup():
     """Test environment variable setup"""
     print("\n🔧 Testing environment setup...")
@@ -150,7 +254,10 @@ def main():
         test_environment_setup,
         test_knowledge_base,
         test_system_instructions,
-        test_analytics_logging
+        test_knowledge_retrieval,
+        test_analytics_logging,
+        test_reply_state_torn_write,
+        test_tweet_filter
     ]
     
     passed = 0
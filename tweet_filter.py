@@ -0,0 +1,240 @@
+"""
+Pre-filter for Twitter mentions
+Runs before the FAQ table, the answer cache or OpenAI and costs under
+a millisecond per tweet. It drops tweets that aren't questions, look like
+promotional spam, or come in a burst from one author, and spots repeats of
+mentions seen in the last TWITTER_DUPLICATE_WINDOW seconds.
+
+The same question from another author (identical once normalized, as in the
+answer cache) gets the reply already generated for it, up to
+TWITTER_DUPLICATE_MAX_REPLIES copies; later copies are skipped. Reworded
+questions are only compared against the author's own recent mentions, to
+skip floods: near-duplicates are found with MinHash signatures of character
+shingles, bucketed by locality-sensitive hashing so a lookup only compares
+against the few earlier tweets sharing a band. Character shingles rate
+"stake" and "unstake" questions as close, so a reworded question from
+someone else is always answered on its own.
+
+A tweet that is checked again (a retry after a failed reply) gets the
+verdict it got the first time.
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+import metrics
+from answer_cache import normalize_question
+from rate_limit import KeyedRateLimiter, acquire
+
+QUESTION_PATTERN = re.compile(
+    r"\?|\b(what|how|when|where|why|who|which|can|could|would|should|is|are|do|does|tell|explain|help)\b",
+    re.IGNORECASE
+)
+GREETING_PATTERN = re.compile(r'^(hey|hi|hello|yo)\s+', re.IGNORECASE)
+LINK_PATTERN = re.compile(r'https?://\S+|\b\w+\.(?:io|me|gg|ly|link|click)/\S*', re.IGNORECASE)
+HANDLE_PATTERN = re.compile(r'@\w+')
+HASHTAG_PATTERN = re.compile(r'#\w+')
+PROMO_PATTERN = re.compile(
+    r"\b(dm me|dm for|check (?:my|out my) (?:bio|profile|pinned)|follow (?:me|back)|giveaway|"
+    r"free (?:mint|tokens?|crypto)|claim (?:now|your)|whatsapp|telegram me|t\.me|100x|1000x|promo code)\b",
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r'\w+')
+
+SHINGLE_SIZE = 4  # Characters; tweets are too short for word shingles
+BANDS = 16
+ROWS = 4  # Signature length is BANDS * ROWS
+HASH_MASK = (1 << 64) - 1
+# One (odd multiplier, offset) pair per signature slot: h -> a*h + b mod 2^64 permutes the hashes
+SEEDS = [(random.Random(seed).getrandbits(64) | 1, random.Random(-seed - 1).getrandbits(64)) for seed in range(BANDS * ROWS)]
+
+@lru_cache(maxsize=8)
+def mention_pattern(bot_username):
+    """Pattern matching mentions of the bot, compiled once per username"""
+    return re.compile(f'@{re.escape(bot_username)}\\b', re.IGNORECASE)
+
+def clean_question(text, bot_username):
+    """Extract the actual question from a tweet"""
+    # Remove the bot mention
+    text = mention_pattern(bot_username).sub('', text)
+    # Remove common prefixes
+    text = GREETING_PATTERN.sub('', text.strip())
+    # Clean up extra whitespace
+    return ' '.join(text.split())
+
+def is_valid_question(text):
+    """Check if the text contains a question word or a question mark"""
+    return QUESTION_PATTERN.search(text) is not None
+
+def spam_reason(text):
+    """Why a tweet looks like spam, or None"""
+    if PROMO_PATTERN.search(text):
+        return 'promo'
+    if len(LINK_PATTERN.findall(text)) >= 2:
+        return 'links'
+    if len(HANDLE_PATTERN.findall(text)) >= 5:
+        return 'mentions'
+    if len(HASHTAG_PATTERN.findall(text)) >= 5:
+        return 'hashtags'
+    letters = sum(ch.isalpha() for ch in text)
+    if len(text) >= 20 and letters < len(text) * 0.4:
+        return 'symbols'
+    return None
+
+def shingles(text):
+    """Overlapping character runs of the text, ignoring case and punctuation"""
+    text = ' '.join(WORD_PATTERN.findall(text.lower()))
+    return {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+
+def stable_hash(item):
+    """64-bit hash of a string, the same in every process (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def minhash(items):
+    """MinHash signature of a set of strings"""
+    hashes = [stable_hash(item) for item in items]
+    return tuple(min((a * h + b) & HASH_MASK for h in hashes) for a, b in SEEDS)
+
+def estimated_similarity(a, b):
+    """Jaccard similarity estimated from two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+class Seen:
+    """A recent mention and, once generated, its reply"""
+    __slots__ = ('key', 'signature', 'user_id', 'at', 'reply', 'copies')
+
+    def __init__(self, key, signature, user_id, at):
+        self.key = key
+        self.signature = signature
+        self.user_id = user_id
+        self.at = at
+        self.reply = asyncio.get_running_loop().create_future()
+        self.copies = 0
+
+class Verdict:
+    """What to do with a mention: `answer` it, `reuse` an earlier reply, or `skip` it"""
+    __slots__ = ('action', 'reason', 'seen')
+
+    def __init__(self, action, reason=None, seen=None):
+        self.action = action
+        self.reason = reason
+        self.seen = seen
+
+class TweetFilter:
+    """Spam, burst and near-duplicate checks, run before any answer is generated"""
+
+    def __init__(self, burst_limit=None, burst_window=None, window=None, threshold=None, max_replies=None, max_seen=5000):
+        self.authors = KeyedRateLimiter(
+            burst_limit or int(os.getenv('TWITTER_AUTHOR_BURST', 3)),
+            burst_window or int(os.getenv('TWITTER_AUTHOR_BURST_WINDOW', 300))
+        )
+        self.window = window or float(os.getenv('TWITTER_DUPLICATE_WINDOW', 3600))
+        self.threshold = threshold or float(os.getenv('TWITTER_DUPLICATE_THRESHOLD', 0.7))
+        self.max_replies = max_replies or int(os.getenv('TWITTER_DUPLICATE_MAX_REPLIES', 3))
+        self.max_seen = max_seen
+        self.seen = deque()  # Oldest first
+        self.exact = {}  # Normalized question -> latest Seen entry
+        self.buckets = {}  # (band, band values) -> Seen entries
+        self.checked = OrderedDict()  # Tweet id -> (time, Verdict), oldest first
+        self.counts = {}
+
+    def _count(self, verdict):
+        key = verdict.reason if verdict.action == 'skip' else verdict.action
+        if verdict.action != 'answer':
+            metrics.TWITTER_PREFILTER.labels(key).inc()
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return verdict
+
+    @property
+    def saved(self):
+        """Mentions that never reached the FAQ table, the cache or OpenAI"""
+        return sum(count for key, count in self.counts.items() if key != 'answer')
+
+    def _bands(self, signature):
+        return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def _expire(self, now):
+        while self.checked:
+            tweet_id, (at, _) = next(iter(self.checked.items()))
+            if now - at <= self.window and len(self.checked) <= self.max_seen:
+                break
+            del self.checked[tweet_id]
+        while self.seen and (now - self.seen[0].at > self.window or len(self.seen) > self.max_seen):
+            old = self.seen.popleft()
+            if self.exact.get(old.key) is old:
+                del self.exact[old.key]
+            for key in self._bands(old.signature):
+                bucket = self.buckets.get(key)
+                if bucket:
+                    bucket.remove(old)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def _similar(self, signature, user_id):
+        best, best_score = None, self.threshold
+        candidates = set()
+        for key in self._bands(signature):
+            for entry in self.buckets.get(key, ()):
+                if entry.user_id == user_id and id(entry) not in candidates:
+                    candidates.add(id(entry))
+                    score = estimated_similarity(signature, entry.signature)
+                    if score >= best_score:
+                        best, best_score = entry, score
+        return best
+
+    def check(self, question, user_id, raw_text='', tweet_id=None):
+        """The Verdict for a cleaned question from `user_id`
+
+        Pass `tweet_id` so that checking the same tweet again returns its
+        first verdict instead of treating it as a copy of itself.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        if tweet_id is not None and tweet_id in self.checked:
+            return self.checked[tweet_id][1]
+        verdict = self._check(question, user_id, raw_text, now)
+        if tweet_id is not None:
+            self.checked[tweet_id] = (now, verdict)
+        return self._count(verdict)
+
+    def _check(self, question, user_id, raw_text, now):
+        if not is_valid_question(question):
+            return Verdict('skip', 'not_question')
+        if spam_reason(raw_text or question):
+            return Verdict('skip', 'spam')
+
+        key = normalize_question(question)
+        original = self.exact.get(key)
+        if original is not None:
+            original.copies += 1
+            if original.user_id == user_id or original.copies > self.max_replies:
+                return Verdict('skip', 'duplicate')
+            return Verdict('reuse', seen=original)
+
+        signature = minhash(shingles(question))
+        if self._similar(signature, user_id) is not None:
+            # The same author rewording a question they just asked
+            return Verdict('skip', 'duplicate')
+
+        # Only new questions use up the author's allowance; repeats were handled above
+        if acquire((self.authors, user_id)):
+            return Verdict('skip', 'burst')
+
+        seen = Seen(key, signature, user_id, now)
+        self.seen.append(seen)
+        self.exact[key] = seen
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(seen)
+        return Verdict('answer', seen=seen)
+
+    @staticmethod
+    def answered(verdict, reply):
+        """Share the reply to an answered mention with its duplicates (None if there is none to share)"""
+        if verdict.seen is not None and not verdict.seen.reply.done():
+            verdict.seen.reply.set_result(reply)
@@ -0,0 +1,186 @@
+"""
+Twitter API access for the mention poller
+Wraps the v1.1 `tweepy.API` and the v2 `tweepy.Client` behind the same few
+calls, so twitter_bot.py can use either (TWITTER_API_MODE=v1 or v2).
+Fetching mentions pages through everything newer than the last handled
+tweet and reports the rate-limit headroom from the response headers. With
+no last handled tweet (a cold start) only the newest few mentions are
+fetched, so a fresh deploy doesn't answer the account's whole backlog.
+"""
+
+import tweepy
+
+COLD_START_MENTIONS = 20
+
+class DuplicateReply(Exception):
+    """Twitter refused the reply because the account already posted the same text"""
+
+def is_duplicate_content(error):
+    """Whether a tweepy error is Twitter's duplicate status rejection (v1.1 error 187, or v2's 403)"""
+    if 187 in getattr(error, 'api_codes', ()):
+        return True
+    return any('duplicate content' in str(message).lower() for message in getattr(error, 'api_messages', ()))
+
+class Mention:
+    """The parts of a mention the bot needs, from either API version"""
+
+    def __init__(self, id, text, user_id, username):
+        self.id = id
+        self.text = text
+        self.user_id = user_id
+        self.username = username
+
+    @classmethod
+    def from_status(cls, status):
+        """Build from a v1.1 Status"""
+        return cls(status.id, status.text, status.user.id, status.user.screen_name)
+
+def parse_rate_limit(headers):
+    """Remaining requests and reset time (epoch seconds) from response headers"""
+    try:
+        return {
+            'remaining': int(headers['x-rate-limit-remaining']),
+            'reset': int(headers['x-rate-limit-reset'])
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class V1Twitter:
+    """Mentions and replies through the v1.1 API"""
+
+    def __init__(self, api):
+        self.api = api
+
+    def get_me(self):
+        """(user id, screen name) of the bot account"""
+        user = self.api.verify_credentials()
+        return user.id, user.screen_name
+
+    def fetch_mentions(self, since_id=None, max_pages=20):
+        """All mentions newer than since_id, oldest first, plus rate-limit headroom
+
+        max_pages is only a safety bound: the mentions timeline reaches back
+        800 tweets at most, which is 4 pages. Without since_id only the
+        newest COLD_START_MENTIONS are returned.
+        """
+        count = 200
+        if since_id is None:
+            count, max_pages = COLD_START_MENTIONS, 1
+        mentions = []
+        rate_limit = None
+        max_id = None
+        pages = 0
+        for _ in range(max_pages):
+            pages += 1
+            page = self.api.mentions_timeline(count=count, since_id=since_id, max_id=max_id)
+            last_response = getattr(self.api, 'last_response', None)
+            rate_limit = parse_rate_limit(getattr(last_response, 'headers', None)) or rate_limit
+            if not page:
+                break
+            mentions.extend(Mention.from_status(status) for status in page)
+            max_id = min(status.id for status in page) - 1
+        if rate_limit:
+            rate_limit['requests'] = pages
+        return sorted(mentions, key=lambda m: m.id), rate_limit
+
+    def get_mention(self, tweet_id):
+        """Fetch a single tweet, or None if it no longer exists"""
+        try:
+            return Mention.from_status(self.api.get_status(tweet_id))
+        except tweepy.NotFound:
+            return None
+
+    def replied_to(self, user_id):
+        """IDs of tweets the bot recently replied to"""
+        timeline = self.api.user_timeline(user_id=user_id, count=200)
+        return {tweet.in_reply_to_status_id for tweet in timeline}
+
+    def post_reply(self, tweet_id, text):
+        """Reply to a tweet; raises DuplicateReply if Twitter rejects the text as a repeat"""
+        try:
+            self.api.update_status(
+                status=text,
+                in_reply_to_status_id=tweet_id,
+                auto_populate_reply_metadata=True
+            )
+        except tweepy.HTTPException as e:
+            if is_duplicate_content(e):
+                raise DuplicateReply(str(e)) from e
+            raise
+
+class V2Twitter:
+    """Mentions and replies through the v2 API"""
+
+    def __init__(self, client):
+        self.client = client
+        self.user_id = None
+
+    def get_me(self):
+        """(user id, username) of the bot account"""
+        me = self.client.get_me(user_auth=True).data
+        self.user_id = me.id
+        return me.id, me.username
+
+    def fetch_mentions(self, since_id=None, max_pages=20):
+        """All mentions newer than since_id, oldest first, plus rate-limit headroom
+
+        Without since_id only the newest COLD_START_MENTIONS are returned.
+        """
+        if self.user_id is None:
+            self.get_me()
+
+        params = {'max_results': 100, 'expansions': 'author_id', 'user.fields': 'username'}
+        if since_id:
+            params['since_id'] = since_id
+        else:
+            params['max_results'] = COLD_START_MENTIONS
+            max_pages = 1
+
+        mentions = []
+        rate_limit = None
+        pages = 0
+        for _ in range(max_pages):
+            pages += 1
+            # Use the raw request so the rate-limit headers are available
+            response = self.client.request('GET', f'/2/users/{self.user_id}/mentions', params=params, user_auth=True)
+            rate_limit = parse_rate_limit(response.headers) or rate_limit
+            body = response.json()
+            users = {u['id']: u['username'] for u in body.get('includes', {}).get('users', [])}
+            for tweet in body.get('data', []):
+                mentions.append(Mention(int(tweet['id']), tweet['text'], int(tweet['author_id']), users.get(tweet['author_id'], '')))
+
+            next_token = body.get('meta', {}).get('next_token')
+            if not next_token:
+                break
+            params['pagination_token'] = next_token
+        if rate_limit:
+            rate_limit['requests'] = pages
+        return sorted(mentions, key=lambda m: m.id), rate_limit
+
+    def get_mention(self, tweet_id):
+        """Fetch a single tweet, or None if it no longer exists"""
+        response = self.client.get_tweet(tweet_id, expansions=['author_id'], user_fields=['username'], user_auth=True)
+        if not response.data:
+            return None
+        users = {u.id: u.username for u in response.includes.get('users', [])}
+        tweet = response.data
+        return Mention(tweet.id, tweet.text, tweet.author_id, users.get(tweet.author_id, ''))
+
+    def replied_to(self, user_id):
+        """IDs of tweets the bot recently replied to"""
+        response = self.client.get_users_tweets(user_id, max_results=100, tweet_fields=['referenced_tweets'], user_auth=True)
+        return {
+            ref.id
+            for tweet in response.data or []
+            for ref in tweet.referenced_tweets or []
+            if ref.type == 'replied_to'
+        }
+
+    def post_reply(self, tweet_id, text):
+        """Reply to a tweet; raises DuplicateReply if Twitter rejects the text as a repeat"""
+        try:
+            self.client.create_tweet(text=text, in_reply_to_tweet_id=tweet_id)
+        except tweepy.HTTPException as e:
+            if is_duplicate_content(e):
+                raise DuplicateReply(str(e)) from e
+            raise
@@ -1,56 +1,64 @@
-import tweepy
-import openai
-import json
 import os
 import time
-from datetime import datetime
+import asyncio
+import threading
+from collections import deque
 from dotenv import load_dotenv
-import re
+import analytics_log
+import metrics
+import structured_log
+import startup_profile
+import llm_client
+from answer_engine import get_engine
+from reply_state import ReplyState
+from tweet_filter import TweetFilter, clean_question
 
 # Load environment variables
 load_dotenv()
 
-# Twitter API configuration
-auth = tweepy.OAuthHandler(
-    os.getenv('TWITTER_API_KEY'),
-    os.getenv('TWITTER_API_SECRET')
-)
-auth.set_access_token(
-    os.getenv('TWITTER_ACCESS_TOKEN'),
-    os.getenv('TWITTER_ACCESS_SECRET')
-)
-
-# Create API object
-api = tweepy.API(auth, wait_on_rate_limit=True)
-
-# Create client for Twitter API v2
-client = tweepy.Client(
-    bearer_token=os.getenv('TWITTER_BEARER_TOKEN'),
-    consumer_key=os.getenv('TWITTER_API_KEY'),
-    consumer_secret=os.getenv('TWITTER_API_SECRET'),
-    access_token=os.getenv('TWITTER_ACCESS_TOKEN'),
-    access_token_secret=os.getenv('TWITTER_ACCESS_SECRET'),
-    wait_on_rate_limit=True
-)
-
-# OpenAI configuration
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-# Load knowledge base
-def load_knowledge_base():
-    try:
-        with open('knowledge.txt', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return "Taofu is a decentralized ecosystem. Visit taofu.xyz for more information."
+logger = structured_log.get_logger('twitter')
 
-# Load system instructions
-def load_system_instructions():
-    try:
-        with open('system_instructions.txt', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return """You are the official Taofu ecosystem assistant on Twitter. You help people learn about the Taofu ecosystem and provide accurate information based on the official documentation.
+# Which API to read mentions and post replies with (v1 or v2)
+TWITTER_API_MODE = os.getenv('TWITTER_API_MODE', 'v1').lower()
+
+# How mentions arrive: `poll` the mentions timeline or `stream` them (v2 filtered stream)
+TWITTER_INGEST = os.getenv('TWITTER_INGEST', 'poll').lower()
+
+# Twitter API adapter, created on first use so importing this module needs no credentials
+twitter = None
+
+def get_twitter():
+    """The Twitter API adapter for TWITTER_API_MODE, importing tweepy on first use"""
+    global twitter
+    if twitter is None:
+        with startup_profile.phase('twitter client'):
+            import tweepy
+            from twitter_api import V1Twitter, V2Twitter
+
+            if TWITTER_API_MODE == 'v2':
+                client = tweepy.Client(
+                    bearer_token=os.getenv('TWITTER_BEARER_TOKEN'),
+                    consumer_key=os.getenv('TWITTER_API_KEY'),
+                    consumer_secret=os.getenv('TWITTER_API_SECRET'),
+                    access_token=os.getenv('TWITTER_ACCESS_TOKEN'),
+                    access_token_secret=os.getenv('TWITTER_ACCESS_SECRET'),
+                    wait_on_rate_limit=True
+                )
+                twitter = V2Twitter(client)
+            else:
+                auth = tweepy.OAuthHandler(
+                    os.getenv('TWITTER_API_KEY'),
+                    os.getenv('TWITTER_API_SECRET')
+                )
+                auth.set_access_token(
+                    os.getenv('TWITTER_ACCESS_TOKEN'),
+                    os.getenv('TWITTER_ACCESS_SECRET')
+                )
+                twitter = V1Twitter(tweepy.API(auth, wait_on_rate_limit=True))
+    return twitter
+
+# Fallback system instructions when system_instructions.txt is missing
+DEFAULT_INSTRUCTIONS = """You are the official Taofu ecosystem assistant on Twitter. You help people learn about the Taofu ecosystem and provide accurate information based on the official documentation.
 
 IMPORTANT RULES:
 1. Only answer questions based on the provided Taofu knowledge base
@@ -61,83 +69,72 @@ IMPORTANT RULES:
 6. Encourage users to visit taofu.xyz for more information
 7. Be friendly and helpful"""
 
-KNOWLEDGE_BASE = load_knowledge_base()
-SYSTEM_INSTRUCTIONS = load_system_instructions()
-
-# Load replied tweets
-def load_replied_tweets():
-    try:
-        with open('replied_tweets.json', 'r') as f:
-            return set(json.load(f))
-    except (FileNotFoundError, json.JSONDecodeError):
-        return set()
+# Analytics logging
+def log_question(user_id, username, question, response_preview, platform="Twitter", **extra):
+    analytics_log.log_question(user_id, username, question, response_preview, platform, **extra)
 
-def save_replied_tweets(replied_tweets):
-    with open('replied_tweets.json', 'w') as f:
-        json.dump(list(replied_tweets), f)
+def engine():
+    """Knowledge base, instructions and answer cache, shared with bot.py when run together by start.py
 
-# Analytics logging
-def log_question(user_id, username, question, response_preview, platform="Twitter"):
-    try:
-        with open('analytics.json', 'r') as f:
-            analytics = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        analytics = []
-    
-    analytics.append({
-        'timestamp': datetime.now().isoformat(),
-        'user_id': str(user_id),
-        'username': username,
-        'question': question,
-        'response_preview': response_preview[:100] + "..." if len(response_preview) > 100 else response_preview,
-        'platform': platform
-    })
-    
-    with open('analytics.json', 'w') as f:
-        json.dump(analytics, f, indent=2)
+    Built on first use rather than at import.
+    """
+    return get_engine(DEFAULT_INSTRUCTIONS)
 
-# System prompt for OpenAI
-SYSTEM_PROMPT = f"""{SYSTEM_INSTRUCTIONS}
+async def get_ai_response(question, stats=None):
+    """Get response from the FAQ table, the answer cache or OpenAI, in that order
 
-TAOFU KNOWLEDGE BASE:
-{KNOWLEDGE_BASE}
+    If given, `stats` is filled with the outcome (faq, llm, cache or fallback)
+    and, when OpenAI was called, the route, model, latency and token usage.
+    """
+    stats = stats if stats is not None else {}
+    # The whole request uses one version of the prompts, even if they reload meanwhile
+    answers = engine()
+    prompts = answers.prompts.bundle
+    precomputed = answers.faq.lookup(question, 'twitter', prompts.version)
+    if precomputed:
+        stats['outcome'] = 'faq'
+        return precomputed
 
-Remember: If asked about specific technical details, tokenomics, or information not covered in the knowledge base, direct users to taofu.xyz for the most current and accurate information."""
+    cached = await asyncio.to_thread(answers.cache.get, question, 'twitter', prompts.version)
+    if cached:
+        logger.debug("Answer cache hit", extra={'hits': answers.cache.hits, 'misses': answers.cache.misses})
+        stats['outcome'] = 'cache'
+        return cached
 
-def get_ai_response(question):
-    """Get response from OpenAI API"""
+    # Simple FAQ-style questions go to the fast model, the rest to GPT-4
+    route = answers.router.route(question, prompts.index)
+    stats['route'] = route.name
+    started = time.perf_counter()
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        answer = await llm_client.chat_completion(
+            model=route.model,
             messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "system", "content": prompts.system_prompt_for(question)},
                 {"role": "user", "content": question}
             ],
             max_tokens=200,  # Shorter for Twitter
-            temperature=0.7
+            temperature=0.7,
+            usage=stats
         )
-        return response.choices[0].message.content.strip()
     except Exception as e:
-        print(f"OpenAI API error: {e}")
+        if isinstance(e, llm_client.CircuitOpenError):
+            # The breaker logs when it opens; no need to log every rejected question
+            logger.debug("OpenAI unavailable, circuit breaker open")
+        else:
+            logger.error("OpenAI API error: %s", e, extra={'route': route.name, 'model': route.model})
+        answers.router.observe(route, started)
+        # Fall back to an FAQ answer from an older knowledge base if there is one
+        stale = answers.faq.lookup(question, 'twitter', None)
+        if stale:
+            stats['outcome'] = 'degraded'
+            return stale
+        stats['outcome'] = 'fallback'
         return "I'm having trouble connecting right now. Please visit taofu.xyz for information."
 
-def clean_question(text, bot_username):
-    """Extract the actual question from a tweet"""
-    # Remove the bot mention
-    text = re.sub(f'@{bot_username}', '', text, flags=re.IGNORECASE)
-    # Remove common prefixes
-    text = re.sub(r'^(hey|hi|hello|yo)\s+', '', text, flags=re.IGNORECASE)
-    # Clean up extra whitespace
-    text = ' '.join(text.split())
-    return text.strip()
-
-def is_valid_question(text):
-    """Check if the text contains a valid question"""
-    # Remove common words that don't indicate a question
-    question_words = ['what', 'how', 'when', 'where', 'why', 'who', 'which', 'can', 'could', 'would', 'should', 'is', 'are', 'do', 'does', 'tell', 'explain', 'help']
-    
-    text_lower = text.lower()
-    return any(word in text_lower for word in question_words) or '?' in text
+    answers.router.observe(route, started, answer)
+    stats['outcome'] = 'llm'
+    await asyncio.to_thread(answers.cache.put, question, answer, 'twitter', prompts.version)
+    return answer
 
 def truncate_response(response, max_length=250):
     """Truncate response to fit Twitter character limit"""
@@ -157,39 +154,155 @@ def truncate_response(response, max_length=250):
     else:
         return truncated + "..."
 
-def monitor_mentions():
-    """Monitor mentions and respond to questions"""
-    replied_tweets = load_replied_tweets()
-    bot_username = api.verify_credentials().screen_name
-    
-    print(f"Monitoring mentions for @{bot_username}")
-    
-    while True:
-        try:
-            # Get mentions
-            mentions = api.mentions_timeline(count=20)
-            
-            for mention in mentions:
-                tweet_id = mention.id
-                
-                # Skip if we've already replied
-                if tweet_id in replied_tweets:
-                    continue
-                
-                # Extract the question
-                question = clean_question(mention.text, bot_username)
-                
-                # Check if it's a valid question
-                if not is_valid_question(question):
-                    print(f"Skipping tweet {tweet_id}: Not a valid question")
-                    replied_tweets.add(tweet_id)
-                    save_replied_tweets(replied_tweets)
-                    continue
-                
-                print(f"Processing question: {question}")
-                
+# Give up on a tweet after this many failed reply attempts
+MAX_REPLY_ATTEMPTS = 3
+
+class PostRateLimiter:
+    """Sliding window limit on tweets posted (Twitter allows 300 per 3 hours)"""
+
+    def __init__(self, limit=None, window=None):
+        self.limit = limit or int(os.getenv('TWITTER_POST_LIMIT', 300))
+        self.window = window or int(os.getenv('TWITTER_POST_WINDOW', 3 * 3600))
+        self.posted = deque()
+
+    async def wait(self):
+        """Wait until another tweet can be posted"""
+        while True:
+            now = time.monotonic()
+            while self.posted and self.posted[0] <= now - self.window:
+                self.posted.popleft()
+            if len(self.posted) < self.limit:
+                self.posted.append(now)
+                return
+            delay = self.posted[0] + self.window - now
+            logger.warning("Post rate limit reached, waiting %.0fs", delay)
+            await asyncio.sleep(delay)
+
+class PollScheduler:
+    """Adapts the mention poll interval to traffic and rate-limit headroom
+
+    Polls faster while mentions keep arriving and backs off while it is
+    quiet, but never so fast that the remaining rate limit runs out before
+    the window resets.
+    """
+
+    def __init__(self, base=None, min_interval=None, max_interval=None):
+        self.base = base or int(os.getenv('TWITTER_CHECK_INTERVAL', 60))
+        self.min_interval = min_interval or float(os.getenv('TWITTER_MIN_INTERVAL', 15))
+        self.max_interval = max_interval or float(os.getenv('TWITTER_MAX_INTERVAL', 300))
+        self.interval = self.base
+
+    def next_interval(self, new_mentions, rate_limit=None):
+        """Seconds to wait before the next poll"""
+        if new_mentions:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+
+        interval = self.interval
+        if rate_limit:
+            # Spread the remaining requests over the rest of the window,
+            # assuming the next poll needs as many pages as the last one
+            until_reset = max(rate_limit['reset'] - time.time(), 0)
+            polls_left = rate_limit['remaining'] // max(rate_limit.get('requests', 1), 1)
+            interval = max(interval, until_reset / polls_left if polls_left else until_reset + 1)
+        return interval
+
+class MentionPipeline:
+    """Answers mentions with a pool of LLM workers and posts them from a single rate-limited poster
+
+    Every tweet is marked pending before it enters the pipeline and done
+    only after its reply is posted, so each tweet gets exactly one reply.
+    """
+
+    def __init__(self, state, bot_username, workers=None):
+        self.state = state
+        self.bot_username = bot_username
+        self.workers = workers or int(os.getenv('TWITTER_LLM_WORKERS', 4))
+        self.answer_queue = asyncio.Queue()
+        self.post_queue = asyncio.Queue()
+        self.limiter = PostRateLimiter()
+        self.prefilter = TweetFilter()
+        self.in_flight = set()
+        self.tasks = []
+        self.posted = 0
+        self.started_at = time.monotonic()
+        metrics.TWITTER_BACKLOG.labels('answer').set_function(self.answer_queue.qsize)
+        metrics.TWITTER_BACKLOG.labels('post').set_function(self.post_queue.qsize)
+
+    def start(self):
+        """Start the LLM workers and the poster"""
+        for i in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._answer_worker(), name=f'answer-worker-{i}'))
+        self.tasks.append(asyncio.create_task(self._post_worker(), name='poster'))
+
+    async def stop(self):
+        """Cancel the pipeline tasks; unfinished tweets stay pending for the next run"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, mention):
+        """Queue a mention that has been marked pending"""
+        if mention.id in self.in_flight:
+            return
+        self.in_flight.add(mention.id)
+        self.answer_queue.put_nowait(mention)
+
+    def report(self):
+        """Log queue depth and throughput"""
+        minutes = (time.monotonic() - self.started_at) / 60
+        rate = self.posted / minutes if minutes else 0.0
+        logger.info("Pipeline status", extra={
+            'awaiting_answer': self.answer_queue.qsize(),
+            'awaiting_post': self.post_queue.qsize(),
+            'in_flight': len(self.in_flight),
+            'posted': self.posted,
+            'posted_per_min': round(rate, 1),
+            'prefilter_saved': self.prefilter.saved
+        })
+
+    async def _answer_worker(self):
+        while True:
+            mention = await self.answer_queue.get()
+            try:
+                reply = await self._prepare_reply(mention)
+                if reply:
+                    await self.post_queue.put((mention.id, *reply))
+                else:
+                    self.in_flight.discard(mention.id)
+            except Exception:
+                # Stays pending so retry_pending tries again
+                logger.exception("Error answering tweet", extra={'tweet_id': mention.id})
+                self.in_flight.discard(mention.id)
+            finally:
+                self.answer_queue.task_done()
+
+    async def _prepare_reply(self, mention):
+        tweet_id = mention.id
+        
+        # Extract the question
+        question = clean_question(mention.text, self.bot_username)
+        
+        # Drop non-questions, spam, bursts and repeats before spending anything on them
+        verdict = self.prefilter.check(question, mention.user_id, mention.text, tweet_id)
+        if verdict.action == 'skip':
+            logger.info("Skipping tweet", extra={'tweet_id': tweet_id, 'reason': verdict.reason})
+            self.state.mark_skipped(tweet_id)
+            return None
+        
+        logger.debug("Processing question", extra={'tweet_id': tweet_id, 'question': question})
+        
+        stats = {}
+        # A copy of a recent mention gets the same reply, once that one has it
+        response = await verdict.seen.reply if verdict.action == 'reuse' else None
+        if response:
+            stats['outcome'] = 'duplicate'
+        else:
+            try:
                 # Get AI response
-                response = get_ai_response(question)
+                response = await get_ai_response(question, stats)
                 
                 # Truncate for Twitter
                 response = truncate_response(response)
@@ -197,51 +310,273 @@ def monitor_mentions():
                 # Add signature if space allows
                 if len(response) < 200:
                     response += " Learn more at taofu.xyz"
+            finally:
+                # Duplicates waiting on this mention get its reply, unless it failed or is an apology
+                self.prefilter.answered(verdict, response if stats.get('outcome') != 'fallback' else None)
+        
+        # Logged by the poster once the reply is up, so a retried tweet is only counted once
+        record = dict(
+            user_id=mention.user_id,
+            username=mention.username,
+            question=question,
+            response_preview=response,
+            platform="Twitter",
+            **stats
+        )
+        # Cached, FAQ and reused replies repeat text word for word, which Twitter
+        # rejects as a duplicate status; addressing the asker keeps each one unique
+        if mention.username:
+            response = f"@{mention.username} {response}"
+        return response, record
+
+    async def _post_worker(self):
+        while True:
+            tweet_id, response, record = await self.post_queue.get()
+            try:
+                await self.limiter.wait()
+                await asyncio.to_thread(get_twitter().post_reply, tweet_id, response)
+                logger.info("Replied to tweet", extra={'tweet_id': tweet_id, 'reply_chars': len(response)})
                 
-                # Log the question
-                log_question(
-                    user_id=mention.user.id,
-                    username=mention.user.screen_name,
-                    question=question,
-                    response_preview=response,
-                    platform="Twitter"
-                )
-                
-                # Reply to the tweet
-                try:
-                    api.update_status(
-                        status=response,
-                        in_reply_to_status_id=tweet_id,
-                        auto_populate_reply_metadata=True
-                    )
-                    print(f"Replied to tweet {tweet_id}: {response}")
-                    
-                    # Mark as replied
-                    replied_tweets.add(tweet_id)
-                    save_replied_tweets(replied_tweets)
-                    
-                except Exception as e:
-                    print(f"Error replying to tweet {tweet_id}: {e}")
+                # Mark as replied
+                self.state.mark_done(tweet_id)
+                log_question(**record)
+                self.posted += 1
+                metrics.TWITTER_REPLIES.inc()
+                startup_profile.milestone('first twitter reply')
+            except Exception as e:
+                # Imported here so the module loads without tweepy (e.g. with a fake API)
+                from twitter_api import DuplicateReply
+                if isinstance(e, DuplicateReply):
+                    # The same text would be rejected again; retrying only uses up the attempts
+                    logger.error("Twitter rejected the reply as duplicate content, giving up", extra={'tweet_id': tweet_id})
+                    self.state.mark_failed(tweet_id)
+                else:
+                    # Left pending so retry_pending tries again
+                    logger.error("Error replying to tweet: %s", e, extra={'tweet_id': tweet_id})
+            finally:
+                self.in_flight.discard(tweet_id)
+                self.post_queue.task_done()
+
+async def retry_pending(pipeline, bot_user_id, attempts):
+    """Requeue tweets left pending by a failed reply or a crash"""
+    state = pipeline.state
+    pending = [tweet_id for tweet_id in state.pending() if tweet_id not in pipeline.in_flight]
+    if not pending:
+        return
+    
+    # A crash between posting and recording leaves a tweet pending that was answered
+    replied_to = await asyncio.to_thread(get_twitter().replied_to, bot_user_id)
+    
+    for tweet_id in pending:
+        if tweet_id in replied_to:
+            state.mark_done(tweet_id)
+            continue
+        
+        attempts[tweet_id] = attempts.get(tweet_id, 0) + 1
+        if attempts[tweet_id] > MAX_REPLY_ATTEMPTS:
+            logger.warning("Giving up on tweet after %d attempts", MAX_REPLY_ATTEMPTS, extra={'tweet_id': tweet_id})
+            state.mark_failed(tweet_id)
+            continue
+        
+        mention = await asyncio.to_thread(get_twitter().get_mention, tweet_id)
+        if mention is None:
+            logger.info("Tweet no longer exists", extra={'tweet_id': tweet_id})
+            state.mark_failed(tweet_id)
+            continue
+        
+        pipeline.submit(mention)
+
+def accept_mentions(state, pipeline, mentions):
+    """Queue the mentions not handled before; returns how many were new
+
+    Mentions must come oldest first, so since_id only moves past tweets we
+    have recorded.
+    """
+    new_mentions = 0
+    for mention in mentions:
+        # Skip if we've already seen it
+        if state.is_handled(mention.id):
+            continue
+        
+        state.mark_pending(mention.id)
+        pipeline.submit(mention)
+        new_mentions += 1
+    return new_mentions
+
+async def poll_once(api, state, pipeline):
+    """Fetch every mention newer than the last one we handled"""
+    with metrics.TWITTER_POLL_LATENCY.time():
+        mentions, rate_limit = await asyncio.to_thread(api.fetch_mentions, state.since_id)
+    startup_profile.milestone('first twitter poll')
+    return accept_mentions(state, pipeline, mentions), rate_limit
+
+async def poll_mentions(api, state, pipeline, bot_user_id, attempts, scheduler, until=None):
+    """Poll for mentions at the scheduler's pace, until the `until` monotonic time if given"""
+    while until is None or time.monotonic() < until:
+        try:
+            await retry_pending(pipeline, bot_user_id, attempts)
+            new_mentions, rate_limit = await poll_once(api, state, pipeline)
+            pipeline.report()
             
             # Wait before next check
-            time.sleep(int(os.getenv('TWITTER_CHECK_INTERVAL', 60)))
+            interval = scheduler.next_interval(new_mentions, rate_limit)
+            remaining = rate_limit['remaining'] if rate_limit else None
+            logger.info("Polled mentions", extra={
+                'new_mentions': new_mentions,
+                'next_check': round(interval),
+                'rate_limit_remaining': remaining
+            })
+            await asyncio.sleep(interval)
             
+        except Exception:
+            logger.exception("Error in mention monitoring")
+            await asyncio.sleep(60)  # Wait a minute before retrying
+
+async def stream_mentions(api, state, pipeline, bot_user_id, bot_username, attempts, housekeeping=None):
+    """Take mentions from the filtered stream as they are posted
+
+    The stream is read on a daemon thread, so shutting down never waits for
+    it. After every (re)connection one since_id poll picks up mentions
+    posted while disconnected, and every `housekeeping` seconds pending
+    tweets are retried. Raises StreamUnavailable when the stream can't be
+    used.
+    """
+    from twitter_stream import MentionStream, StreamUnavailable
+
+    housekeeping = housekeeping or int(os.getenv('TWITTER_CHECK_INTERVAL', 60))
+    stream = MentionStream(bot_username)
+    try:
+        await asyncio.to_thread(stream.sync_rules)
+    except StreamUnavailable:
+        raise
+    except Exception as e:
+        raise StreamUnavailable(f"could not set stream rules: {e}") from e
+
+    loop = asyncio.get_running_loop()
+    connected = asyncio.Event()
+    finished = loop.create_future()
+    # Streamed mentions wait here during a catch-up poll: accepting a newer
+    # tweet first would move since_id past the older ones the poll is fetching
+    held = None
+
+    def on_connect():
+        nonlocal held
+        held = []
+        connected.set()
+
+    def deliver(mention):
+        if held is not None:
+            held.append(mention)
+        else:
+            accept_mentions(state, pipeline, [mention])
+
+    def settle(error):
+        if finished.done():
+            return
+        if error:
+            finished.set_exception(error)
+        else:
+            finished.set_result(None)
+
+    def read():
+        error = None
+        try:
+            stream.run(lambda mention: loop.call_soon_threadsafe(deliver, mention),
+                       lambda: loop.call_soon_threadsafe(on_connect))
         except Exception as e:
-            print(f"Error in mention monitoring: {e}")
-            time.sleep(60)  # Wait a minute before retrying
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, error)
+        except RuntimeError:
+            pass  # The loop has already shut down
+
+    threading.Thread(target=read, name='twitter-stream', daemon=True).start()
+    try:
+        while not finished.done():
+            try:
+                await asyncio.wait_for(connected.wait(), timeout=housekeeping)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                if connected.is_set():
+                    connected.clear()
+                    mentions = []
+                    try:
+                        with metrics.TWITTER_POLL_LATENCY.time():
+                            mentions, _ = await asyncio.to_thread(api.fetch_mentions, state.since_id)
+                    finally:
+                        mentions += held or []
+                        held = None
+                        new_mentions = accept_mentions(state, pipeline, sorted(mentions, key=lambda m: m.id))
+                    logger.info("Caught up after stream connect", extra={'new_mentions': new_mentions})
+                await retry_pending(pipeline, bot_user_id, attempts)
+                pipeline.report()
+            except Exception:
+                logger.exception("Error in mention monitoring")
+        await finished
+    finally:
+        stream.close()
+
+async def monitor_mentions():
+    """Monitor mentions and respond to questions
+
+    With TWITTER_INGEST=stream mentions arrive through the filtered stream,
+    falling back to polling for TWITTER_STREAM_RETRY seconds whenever the
+    stream is unavailable. Otherwise the mentions timeline is polled.
+    """
+    # Create the client, build the prompts and import the OpenAI client off the event loop
+    api = await asyncio.to_thread(get_twitter)
+    bot_user_id, bot_username = await asyncio.to_thread(api.get_me)
+    await asyncio.to_thread(engine)
+    await asyncio.to_thread(llm_client.warm_up)
+    state = ReplyState()
+    attempts = {}
+    scheduler = PollScheduler()
+    pipeline = MentionPipeline(state, bot_username)
+    pipeline.start()
+    prompt_reloader = engine().start_reloader()
+    
+    logger.info("Monitoring mentions for @%s", bot_username, extra={
+        'api': TWITTER_API_MODE,
+        'ingest': TWITTER_INGEST,
+        'since_id': state.since_id,
+        'workers': pipeline.workers
+    })
+    
+    try:
+        if TWITTER_INGEST == 'stream':
+            from twitter_stream import StreamUnavailable
+            retry = float(os.getenv('TWITTER_STREAM_RETRY', 900))
+            while True:
+                try:
+                    await stream_mentions(api, state, pipeline, bot_user_id, bot_username, attempts)
+                except StreamUnavailable as e:
+                    logger.warning("Filtered stream unavailable, polling for %.0fs: %s", retry, e)
+                    await poll_mentions(api, state, pipeline, bot_user_id, attempts, scheduler, until=time.monotonic() + retry)
+        else:
+            await poll_mentions(api, state, pipeline, bot_user_id, attempts, scheduler)
+    finally:
+        if prompt_reloader:
+            prompt_reloader.cancel()
+        await pipeline.stop()
+        state.close()
 
 def main():
     """Main function to run the Twitter bot"""
+    if os.getenv('METRICS_PORT'):
+        import app
+        app.start_background()
+    
     try:
         # Verify credentials
-        user = api.verify_credentials()
-        print(f"Twitter bot authenticated as @{user.screen_name}")
+        _, username = get_twitter().get_me()
+        logger.info("Twitter bot authenticated as @%s", username)
         
         # Start monitoring mentions
-        monitor_mentions()
+        asyncio.run(monitor_mentions())
         
-    except Exception as e:
-        print(f"Error starting Twitter bot: {e}")
+    except Exception:
+        logger.exception("Error starting Twitter bot")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
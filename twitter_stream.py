@@ -0,0 +1,163 @@
+"""
+Mentions from the Twitter v2 filtered stream
+Instead of polling the mentions timeline, the bot keeps one long-lived
+connection to the filtered stream with a rule matching tweets that mention
+it, so a mention reaches the reply pipeline within about a second and no
+poll requests are spent while it is quiet.
+
+The stream is read with `requests` on its own thread. Dropped connections
+are reopened with Twitter's recommended backoff (linear for network errors,
+exponential for HTTP errors, starting at a minute for 429s). When the
+account has no stream access, or the stream keeps failing, StreamUnavailable
+tells twitter_bot.py to fall back to polling.
+
+TWITTER_STREAM_URL points the client somewhere else than api.twitter.com,
+e.g. at fake_twitter_stream.py for local testing.
+"""
+
+import json
+import logging
+import os
+import threading
+
+import requests
+
+from twitter_api import Mention
+
+STREAM_URL = 'https://api.twitter.com'
+RULE_TAG = 'taofu-mentions'
+
+logger = logging.getLogger('taofu.twitter_stream')
+
+class StreamUnavailable(Exception):
+    """The filtered stream can't be used right now; poll instead"""
+
+def reconnect_delay(kind, failures):
+    """Seconds to wait before reconnect attempt number `failures` (1-based)
+
+    Follows Twitter's reconnection guidelines: network errors back off
+    linearly from 250 ms to 16 s, HTTP errors exponentially from 5 s to
+    320 s, and rate-limit (429) errors exponentially from 60 s.
+    """
+    if kind == 'network':
+        return min(0.25 * failures, 16.0)
+    if kind == 'rate_limit':
+        return min(60.0 * 2 ** (failures - 1), 960.0)
+    return min(5.0 * 2 ** (failures - 1), 320.0)
+
+def parse_mention(line):
+    """A Mention from one line of the stream, or None for keep-alives and system messages"""
+    line = line.strip()
+    if not line:
+        return None
+    event = json.loads(line)
+    tweet = event.get('data')
+    if not tweet:
+        # Operational disconnect notices and the like
+        if event.get('errors'):
+            logger.warning("Stream error event: %s", event['errors'])
+        return None
+    users = {u['id']: u['username'] for u in event.get('includes', {}).get('users', [])}
+    return Mention(int(tweet['id']), tweet['text'], int(tweet['author_id']), users.get(tweet['author_id'], ''))
+
+class MentionStream:
+    """Filtered stream connection delivering mentions of one account"""
+
+    def __init__(self, bot_username, bearer_token=None, base_url=None, stall_timeout=None, max_failures=None):
+        self.bot_username = bot_username
+        self.bearer_token = bearer_token or os.getenv('TWITTER_BEARER_TOKEN')
+        self.base_url = (base_url or os.getenv('TWITTER_STREAM_URL', STREAM_URL)).rstrip('/')
+        # Twitter sends a keep-alive every 20 seconds; silence for longer means the connection is dead
+        self.stall_timeout = stall_timeout or float(os.getenv('TWITTER_STREAM_STALL_TIMEOUT', 90))
+        self.max_failures = max_failures or int(os.getenv('TWITTER_STREAM_MAX_FAILURES', 6))
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {self.bearer_token}"
+        self.response = None
+        self.connects = 0
+        self._closed = threading.Event()
+
+    @property
+    def rule(self):
+        """Mentions of the bot, excluding its own tweets and retweets"""
+        return f"@{self.bot_username} -from:{self.bot_username} -is:retweet"
+
+    def _check(self, response):
+        if response.status_code in (401, 403):
+            raise StreamUnavailable(f"no filtered stream access (HTTP {response.status_code})")
+        response.raise_for_status()
+        return response.json()
+
+    def sync_rules(self):
+        """Make our rule the only one with our tag, leaving other rules alone"""
+        if not self.bearer_token:
+            raise StreamUnavailable("TWITTER_BEARER_TOKEN is not set")
+        url = f"{self.base_url}/2/tweets/search/stream/rules"
+        rules = self._check(self.session.get(url, timeout=10)).get('data', [])
+        ours = [rule for rule in rules if rule.get('tag') == RULE_TAG]
+        stale = [rule['id'] for rule in ours if rule['value'] != self.rule]
+        if stale:
+            self._check(self.session.post(url, json={'delete': {'ids': stale}}, timeout=10))
+        if len(stale) == len(ours):
+            self._check(self.session.post(url, json={'add': [{'value': self.rule, 'tag': RULE_TAG}]}, timeout=10))
+            logger.info("Added filtered stream rule", extra={'rule': self.rule})
+
+    def run(self, on_mention, on_connect=None):
+        """Read the stream until close(), reconnecting as needed (blocking)
+
+        `on_mention(mention)` is called for every mention and `on_connect()`
+        after every successful (re)connection, so the caller can catch up on
+        anything missed while disconnected. Raises StreamUnavailable when the
+        stream can't be used.
+        """
+        failures = 0
+        while not self._closed.is_set():
+            kind = None
+            try:
+                self.response = self.session.get(
+                    f"{self.base_url}/2/tweets/search/stream",
+                    params={'expansions': 'author_id', 'user.fields': 'username'},
+                    stream=True,
+                    timeout=(10, self.stall_timeout)
+                )
+                with self.response:
+                    if self.response.status_code == 429:
+                        kind = 'rate_limit'
+                    elif self.response.status_code in (401, 403):
+                        raise StreamUnavailable(f"no filtered stream access (HTTP {self.response.status_code})")
+                    elif self.response.status_code != 200:
+                        kind = 'http'
+                    else:
+                        failures = 0
+                        self.connects += 1
+                        logger.info("Connected to filtered stream", extra={'connects': self.connects})
+                        if on_connect:
+                            on_connect()
+                        for line in self.response.iter_lines():
+                            mention = parse_mention(line)
+                            if mention:
+                                on_mention(mention)
+                            if self._closed.is_set():
+                                return
+                        kind = 'network'  # The server closed the stream
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if self._closed.is_set():
+                    return
+                logger.debug("Filtered stream connection lost: %s", e)
+                kind = 'network'
+            except ValueError as e:
+                logger.warning("Unreadable filtered stream message: %s", e)
+                kind = 'network'
+
+            failures += 1
+            if failures > self.max_failures:
+                raise StreamUnavailable(f"{failures - 1} reconnects failed (last: {kind})")
+            delay = reconnect_delay(kind, failures)
+            logger.warning("Filtered stream disconnected, reconnecting in %.1fs", delay, extra={'reason': kind, 'failures': failures})
+            self._closed.wait(delay)
+
+    def close(self):
+        """Stop run() and drop the connection"""
+        self._closed.set()
+        response = self.response
+        if response is not None:
+            response.close()